@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark: charge ingest and aggregate queries per storage backend"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+# custom modules
+from lib import crud  # noqa: E402  pylint: disable=wrong-import-position
+from lib import keba  # noqa: E402  pylint: disable=wrong-import-position
+from lib import keba_model  # noqa: E402  pylint: disable=wrong-import-position
+import synthetic  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def open_backend(db_url: str):
+    """
+    open a storage backend for a database url
+    :param db_url: database url, see crud.database_url
+    :return: KebaDB or KebaParquetStore
+    """
+    os.environ["DB_URL"] = db_url
+    # every backend gets its own engine
+    crud._engine = None  # pylint: disable=protected-access
+    crud._session_factory = None  # pylint: disable=protected-access
+    backend = crud.open_database()
+    backend.setup()
+    return backend
+
+
+def timed(function) -> tuple:
+    """
+    run function once
+    :param function: callable without arguments
+    :return: tuple (result, seconds)
+    """
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000, help='charge sessions')
+    parser.add_argument('--mysql-url', help='also benchmark this MySQL/MariaDB url (empty database)')
+    param = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    backends = {
+        "sqlite (wal)": f"sqlite:///{os.path.join(tmp_dir, 'keba.db')}",
+        "parquet": f"parquet://{os.path.join(tmp_dir, 'parquet')}",
+    }
+    if param.mysql_url:
+        backends["mysql"] = param.mysql_url
+
+    charges = [
+        keba_model.KebaChargeReport(**x).as_dict() for x in keba.csv_to_dict(
+            synthetic.gen_charge_csv(param.rows), keba.table_header_charges(), ";", True
+        )
+    ]
+    month_start, month_end = datetime(2022, 3, 1), datetime(2022, 4, 1)
+
+    print(f"{'backend':14} {'ingest rows/sec':>16} {'re-import':>10} {'sum all':>9} {'sum month':>10}")
+    try:
+        for name, url in backends.items():
+            backend = open_backend(url)
+            _, ingest = timed(lambda: backend.insert_charges(charges))
+            _, reimport = timed(lambda: backend.insert_charges(charges[:10000]))
+            _, query_all = timed(backend.consumption_by_rfid)
+            _, query_month = timed(lambda: backend.consumption_by_rfid(month_start, month_end))
+            print(f"{name:14} {param.rows / ingest:16,.0f} {reimport:9.2f}s "
+                  f"{query_all * 1000:7.1f}ms {query_month * 1000:8.1f}ms")
+    finally:
+        shutil.rmtree(tmp_dir)
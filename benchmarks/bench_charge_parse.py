@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark: charge csv parsing, legacy strptime records vs. slotted records"""
+import os
+import sys
+import csv
+import time
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+# custom modules
+from lib import keba  # noqa: E402  pylint: disable=wrong-import-position
+from lib import keba_model  # noqa: E402  pylint: disable=wrong-import-position
+from synthetic import gen_charge_csv  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def legacy_charge(row: dict) -> dict:
+    """
+    charge translation before the fast parser: strptime, str() round-trip and vars()
+    :param row: csv row
+    :return: dict of charge
+    """
+    date_format = '%d-%m-%Y %H:%M:%S'
+    return {
+        'StationID': int(row['StationID']),
+        'Serial': row['Serial'],
+        'RFID': row['RFID'],
+        'Status': row['Status'],
+        'Start': str(datetime.strptime(str(row['Start']), date_format)),
+        'End': str(datetime.strptime(str(row['End']), date_format)),
+        'Duration': int(row['Duration']),
+        'MeterStart': round(float(row['MeterStart'])),
+        'MeterEnd': round(float(row['MeterEnd'])),
+        'Consumption': float(row['Consumption']),
+    }
+
+
+def current_charge(row: dict) -> dict:
+    """
+    charge translation with the slotted KebaChargeReport
+    :param row: csv row
+    :return: dict of charge
+    """
+    return keba_model.KebaChargeReport(**row).as_dict()
+
+
+def run(csv_content: str, convert) -> float:
+    """
+    parse the export and return rows/sec
+    :param csv_content: csv content with header
+    :param convert: row translation function
+    """
+    started = time.perf_counter()
+    lines = iter(csv_content.splitlines())
+    next(lines)
+    count = 0
+    for row in csv.DictReader(lines, fieldnames=keba.table_header_charges(), delimiter=";"):
+        convert(row)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000, help='synthetic charge sessions')
+    parser.add_argument('--repeat', type=int, default=3, help='best of x runs')
+    param = parser.parse_args()
+
+    content = gen_charge_csv(param.rows)
+    legacy = max(run(content, legacy_charge) for _ in range(param.repeat))
+    current = max(run(content, current_charge) for _ in range(param.repeat))
+    print(f"rows:    {param.rows}")
+    print(f"legacy:  {legacy:12,.0f} rows/sec")
+    print(f"current: {current:12,.0f} rows/sec ({current / legacy:.2f}x)")
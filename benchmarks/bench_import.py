@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark: get_report.py flows end-to-end against the local WebUI stand-in"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from mock_webui import MockWebUI
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# name -> get_report.py arguments, flows run in this order on the same database
+IMPORT_FLOWS = {
+    "rfid": ["-r"],
+    "station": ["-s"],
+    "charge (first run)": ["-c"],
+    "charge (incremental)": ["-c"],
+    "charge (full window)": ["-c", "-f"],
+    "all": ["-a"],
+}
+
+
+def run_flow(arguments: list, env: dict) -> tuple[float, int]:
+    """
+    run get_report.py and measure it
+    :param arguments: get_report.py arguments
+    :param env: process environment
+    :return: tuple (seconds, peak rss in KiB)
+    """
+    started = time.perf_counter()
+    with subprocess.Popen(
+        [sys.executable, os.path.join(BASE_DIR, "get_report.py")] + arguments,
+        cwd=BASE_DIR, env=env
+    ) as process:
+        _, status, rusage = os.wait4(process.pid, 0)
+        # wait4 reaped the child, tell Popen about it
+        process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise SystemExit(f"get_report.py {' '.join(arguments)} failed: {process.returncode}")
+    return time.perf_counter() - started, rusage.ru_maxrss
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--charges', type=int, default=20000, help='charge sessions')
+    parser.add_argument('--rfids', type=int, default=200, help='rfid cards')
+    parser.add_argument('--stations', type=int, default=8, help='wallbox stations')
+    parser.add_argument('--latency', type=float, default=0.01, help='request delay in seconds')
+    parser.add_argument('--export-rate', type=float, default=50000.0,
+                        help='exported charge sessions per second')
+    parser.add_argument('--db-url', help='database url, default: temporary sqlite file')
+    param = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, MockWebUI(
+        charges=param.charges, rfids=param.rfids, stations=param.stations,
+        latency=param.latency, export_rate=param.export_rate
+    ) as webui:
+        flow_env = dict(
+            os.environ,
+            KEBA_HOST=webui.hostname,
+            KEBA_PROTO="http",
+            KEBA_SESSION_CACHE=os.path.join(tmp_dir, "cache"),
+            DB_URL=param.db_url or f"sqlite:///{os.path.join(tmp_dir, 'keba.db')}",
+        )
+        print(f"charges {param.charges}, rfid cards {param.rfids}, stations {param.stations}, "
+              f"latency {param.latency * 1000:.0f} ms")
+        print(f"{'flow':22} {'seconds':>8} {'rows/sec':>10} {'peak rss':>10} {'requests':>9}")
+        for name, flow in IMPORT_FLOWS.items():
+            requests_before = webui.requests
+            webui.export["total"] = 0
+            duration, peak_rss = run_flow(flow, flow_env)
+            # charge sessions in the export window of this run
+            rows = webui.export["total"]
+            rate = f"{rows / duration:10,.0f}" if rows else f"{'-':>10}"
+            print(f"{name:22} {duration:8.2f} {rate} {peak_rss / 1024:7.1f} MB "
+                  f"{webui.requests - requests_before:9}")
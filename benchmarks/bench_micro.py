@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Microbenchmarks: csv parsing, model classes and crud inserts"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+# custom modules
+from sqlalchemy import create_engine  # noqa: E402  pylint: disable=wrong-import-position
+from sqlalchemy.orm import Session  # noqa: E402  pylint: disable=wrong-import-position
+from lib import crud  # noqa: E402  pylint: disable=wrong-import-position
+from lib import keba  # noqa: E402  pylint: disable=wrong-import-position
+from lib import keba_model  # noqa: E402  pylint: disable=wrong-import-position
+from lib import telemetry  # noqa: E402  pylint: disable=wrong-import-position
+import synthetic  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def measure(name: str, rows: int, prepare) -> None:
+    """
+    print rows/sec and peak python memory, measured in two separate runs
+    :param name: benchmark name
+    :param rows: rows processed by the benchmark
+    :param prepare: callable returning a new benchmark function without arguments
+    """
+    function = prepare()
+    started = time.perf_counter()
+    function()
+    duration = time.perf_counter() - started
+
+    function = prepare()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:28} {rows:8} rows {rows / duration:12,.0f} rows/sec {peak / 2**20:8.1f} MB peak")
+
+
+def memory_db() -> crud.KebaDB:
+    """KebaDB on a new in-memory sqlite database"""
+    db_engine = create_engine("sqlite://")
+    crud.Base.metadata.create_all(db_engine)
+    return crud.KebaDB(db_session=Session(db_engine))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000, help='charge sessions')
+    parser.add_argument('--cards', type=int, default=5000, help='rfid cards')
+    param = parser.parse_args()
+
+    charge_csv = synthetic.gen_charge_csv(param.rows)
+    csv_rows = keba.csv_to_dict(charge_csv, keba.table_header_charges(), ";", True)
+    charges = [keba_model.KebaChargeReport(**x).as_dict() for x in csv_rows]
+    rfid_cards = synthetic.gen_rfid_cards(param.cards)
+    rfid_rows = [vars(keba_model.KebaRFID(**x)) for x in rfid_cards]
+    stations = synthetic.gen_stations(100)
+
+    measure("csv_to_dict", param.rows, lambda: lambda: keba.csv_to_dict(
+        charge_csv, keba.table_header_charges(), ";", True
+    ))
+    measure("KebaChargeReport", param.rows, lambda: lambda: [
+        keba_model.KebaChargeReport(**x).as_dict() for x in csv_rows
+    ])
+    measure("KebaRFID", param.cards, lambda: lambda: [
+        vars(keba_model.KebaRFID(**x)) for x in rfid_cards
+    ])
+    measure("KebaStation", len(stations) * 100, lambda: lambda: [
+        vars(keba_model.KebaStation(**x)) for x in stations * 100
+    ])
+
+    meter_samples = [
+        keba_model.StationMeter(**synthetic.gen_meter()).sample() for _ in range(1000)
+    ]
+
+    def prepare_telemetry():
+        """one day of 5 second samples of one station, downsampled to minutes"""
+        def collect():
+            buffer = telemetry.MeterRingBuffer(17280)
+            for number in range(17280):
+                buffer.append(number * 5.0, meter_samples[number % 1000])
+            telemetry.downsample("22269600", buffer.pop_until(86400.0), 60)
+        return collect
+
+    measure("MeterRingBuffer+downsample", 17280, prepare_telemetry)
+
+    def prepare_db(function, preload: bool):
+        """new database, optional with all rows already imported"""
+        db = memory_db()
+        if preload:
+            function(db)
+        return lambda: function(db)
+
+    for preload, state in ((False, "new"), (True, "known")):
+        measure(f"insert_charges ({state})", param.rows, lambda: prepare_db(
+            lambda db: db.insert_charges(charges), preload
+        ))
+        measure(f"sync_rfid_cards ({state})", param.cards, lambda: prepare_db(
+            lambda db: db.sync_rfid_cards(rfid_rows), preload
+        ))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark: cli startup and module import time"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+from statistics import median
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# name -> command line, no database or wallbox is contacted
+STARTUP_COMMANDS = {
+    "get_report.py -v": [sys.executable, os.path.join(BASE_DIR, "get_report.py"), "-v"],
+    "get_report.py -h": [sys.executable, os.path.join(BASE_DIR, "get_report.py"), "-h"],
+    "import lib.keba": [sys.executable, "-c", "import lib.keba"],
+    "import lib.crud": [sys.executable, "-c", "import lib.crud"],
+}
+
+
+def measure(command: list, repeat: int) -> float:
+    """
+    median wall time of a command
+    :param command: command line
+    :param repeat: number of runs
+    :return: milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        # get_report.py -v exits with status 1, the exit code is not relevant here
+        subprocess.run(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - started) * 1000)
+    return median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=10, help='runs per command')
+    parser.add_argument('--max-ms', type=float,
+                        help='fail if "get_report.py -v" is slower than this')
+    param = parser.parse_args()
+
+    results = {name: measure(command, param.repeat) for name, command in STARTUP_COMMANDS.items()}
+    for name, duration in results.items():
+        print(f"{name:20} {duration:8.1f} ms")
+
+    if param.max_ms and results["get_report.py -v"] > param.max_ms:
+        sys.exit(f"startup regression: {results['get_report.py -v']:.1f} ms > {param.max_ms} ms")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Local Keba WebUI stand-in with synthetic data and configurable latency"""
+import json
+import math
+import time
+import random
+import secrets
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import synthetic
+
+LOGIN_PAGE = (
+    '<!DOCTYPE html><html><head><meta charset="utf-8"/>'
+    '<meta content="{csrf}" name="csrf-token"/><title>KEBA eMobility</title></head>'
+    '<body><div id="app"></div></body></html>'
+)
+
+
+class MockWebUI:
+    """Keba WebUI stand-in: login, cpmrestrequest, charge export"""
+
+    def __init__(self, charges: int = 1000, rfids: int = 50, stations: int = 8,
+                 latency: float = 0.0, export_rate: float = 50000.0, open_sessions: int = 0,
+                 error_rate: float = 0.0, host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        init class definition
+        :param charges: charge sessions in the export
+        :param rfids: rfid cards
+        :param stations: wallbox stations
+        :param latency: delay of every request in seconds
+        :param export_rate: exported charge sessions per second
+        :param open_sessions: newest charge sessions without End
+        :param error_rate: share of requests answered with 503, e.g. for retry tests
+        :param host: listen address
+        :param port: listen port, 0 for a free port
+        """
+        self.charges = charges
+        self.rfids = rfids
+        self.stations = stations
+        self.latency = latency
+        self.export_rate = export_rate
+        self.open_sessions = open_sessions
+        self.error_rate = error_rate
+        # all sessions fit into the default 45 days export window
+        self.interval = min(timedelta(minutes=7), timedelta(days=40) / max(charges, 1))
+        self.start = datetime.now().replace(microsecond=0) - self.interval * charges
+        self.csrf = secrets.token_hex(16)
+        self.sessions = set()
+        self.requests = 0
+        self.errors = 0
+        self.logins = 0
+        self.export = {"total": 0, "first": 0, "last": 0, "started": 0.0}
+        self.exports = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), MockWebUIHandler)
+        self.server.webui = self
+        self.thread = None
+
+    @property
+    def hostname(self) -> str:
+        """host:port for KEBA_HOST"""
+        return f"{self.server.server_address[0]}:{self.server.server_address[1]}"
+
+    def start_export(self, since_ms: int, until_ms: int = None) -> None:
+        """
+        start a charge export from a unix timestamp in milliseconds
+        :param since_ms: export sessions starting after this timestamp
+        :param until_ms: export sessions starting before this timestamp, None for all
+        """
+        since = datetime.fromtimestamp(since_ms / 1000)
+        first = max(0, math.ceil((since - self.start) / self.interval))
+        last = self.charges
+        if until_ms:
+            until = datetime.fromtimestamp(until_ms / 1000)
+            last = min(last, max(0, math.ceil((until - self.start) / self.interval)))
+        with self.lock:
+            self.exports += 1
+            self.export = {
+                "total": max(0, last - first),
+                "first": first,
+                "last": last,
+                "started": time.monotonic()
+            }
+
+    def export_status(self) -> dict:
+        """export progress {"total": x, "exported": y}"""
+        with self.lock:
+            elapsed = time.monotonic() - self.export["started"]
+            total = self.export["total"]
+        return {"total": total, "exported": min(total, int(elapsed * self.export_rate))}
+
+    def export_lines(self):
+        """csv lines of the current export"""
+        return synthetic.gen_charge_lines(
+            self.charges, stations=self.stations, start=self.start, interval=self.interval,
+            first=self.export["first"], open_sessions=self.open_sessions, last=self.export["last"]
+        )
+
+    def expire_sessions(self) -> None:
+        """invalidate all login sessions, clients have to login again"""
+        with self.lock:
+            self.sessions.clear()
+
+    def start_server(self) -> "MockWebUI":
+        """serve in a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop_server(self) -> None:
+        """stop the background server"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start_server()
+
+    def __exit__(self, *args):
+        self.stop_server()
+
+
+class MockWebUIHandler(BaseHTTPRequestHandler):
+    """request handler of MockWebUI"""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """no access log"""
+
+    @property
+    def webui(self) -> MockWebUI:
+        """server state"""
+        return self.server.webui
+
+    def __begin(self) -> bool:
+        """
+        count and delay the request, fail it randomly by error_rate
+        :return: True if the request was answered with 503
+        """
+        with self.webui.lock:
+            self.webui.requests += 1
+        if self.webui.latency:
+            time.sleep(self.webui.latency)
+        if self.webui.error_rate and random.random() < self.webui.error_rate:
+            with self.webui.lock:
+                self.webui.errors += 1
+            self.send_error(503)
+            return True
+        return False
+
+    def __session_id(self):
+        """session cookie of the request"""
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        return cookie["PHPSESSID"].value if "PHPSESSID" in cookie else None
+
+    def __send(self, body: bytes, content_type: str = "application/json", headers: dict = None):
+        """send complete response"""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __send_json(self, content) -> None:
+        """send json response"""
+        self.__send(json.dumps(content).encode())
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """login page and csv export"""
+        if self.__begin():
+            return
+        if self.path == "/":
+            self.__send(LOGIN_PAGE.format(csrf=self.webui.csrf).encode(), "text/html")
+            return
+
+        if self.path.startswith("/export.php"):
+            if self.__session_id() not in self.webui.sessions:
+                self.__send(b"Access Denied", "text/html")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv;charset=UTF-8")
+            self.send_header(
+                "Content-Disposition", 'attachment; filename="ChargingSession_22269607.csv"'
+            )
+            self.end_headers()
+            # streamed without Content-Length, the connection is closed afterwards
+            chunk = []
+            for line in self.webui.export_lines():
+                chunk.append(line)
+                if len(chunk) == 1000:
+                    self.wfile.write(("\r\n".join(chunk) + "\r\n").encode())
+                    chunk = []
+            if chunk:
+                self.wfile.write(("\r\n".join(chunk) + "\r\n").encode())
+            return
+
+        self.send_error(404)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """ajax.php: login, cpmrestrequest, exportchargingsessions"""
+        if self.__begin():
+            return
+        if self.path != "/ajax.php":
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_error(400)
+            return
+
+        if payload.get("csrftoken") != self.webui.csrf:
+            self.__send(b"Access Denied", "text/html")
+            return
+
+        if "username" in payload:
+            session_id = secrets.token_hex(16)
+            with self.webui.lock:
+                self.webui.sessions.add(session_id)
+                self.webui.logins += 1
+            self.__send(b"{}", headers={"Set-Cookie": f"PHPSESSID={session_id}; path=/"})
+            return
+
+        if self.__session_id() not in self.webui.sessions:
+            self.__send(b"Access Denied", "text/html")
+            return
+
+        if "exportchargingsessions" in payload:
+            columns = {
+                x["data"]: x["search"]["value"]
+                for x in payload["exportchargingsessions"]["columns"]
+            }
+            self.webui.start_export(
+                int(columns.get("startDate") or 0), int(columns.get("endDate") or 0) or None
+            )
+            self.__send_json({})
+            return
+
+        path = payload.get("cpmrestrequest", {}).get("path")
+        if path == "/chargingsessions/export/status":
+            self.__send_json(self.webui.export_status())
+        elif path == "/chargingtokens":
+            self.__send_json(synthetic.gen_rfid_cards(self.webui.rfids, self.webui.stations))
+        elif path == "/wallboxes":
+            self.__send_json(synthetic.gen_stations(self.webui.stations))
+        else:
+            self.send_error(404)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default="127.0.0.1", help='listen address')
+    parser.add_argument('--port', type=int, default=8080, help='listen port')
+    parser.add_argument('--charges', type=int, default=1000, help='charge sessions')
+    parser.add_argument('--rfids', type=int, default=50, help='rfid cards')
+    parser.add_argument('--stations', type=int, default=8, help='wallbox stations')
+    parser.add_argument('--latency', type=float, default=0.0, help='request delay in seconds')
+    parser.add_argument('--export-rate', type=float, default=50000.0,
+                        help='exported charge sessions per second')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of requests answered with 503')
+    param = parser.parse_args()
+
+    webui = MockWebUI(
+        charges=param.charges, rfids=param.rfids, stations=param.stations,
+        latency=param.latency, export_rate=param.export_rate, error_rate=param.error_rate,
+        host=param.host, port=param.port
+    )
+    print(f"Keba WebUI stand-in on http://{webui.hostname}/ (KEBA_HOST={webui.hostname})")
+    try:
+        webui.server.serve_forever()
+    except KeyboardInterrupt:
+        webui.server.server_close()
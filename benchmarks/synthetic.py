@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Synthetic Keba WebUI payloads for benchmarks"""
+import random
+from datetime import datetime, timedelta
+
+# charge export timestamp layout
+DATE_FORMAT = '%d-%m-%Y %H:%M:%S'
+CHARGE_HEADER = "Wallbox;Serial;RFID;Status;Start;End;Duration;MeterStart;MeterEnd;Consumption"
+
+
+def gen_serials(stations: int) -> list:
+    """
+    wallbox serial numbers
+    :param stations: number of wallboxes
+    :return: list of serial numbers
+    """
+    return [f"2226{9600 + x:04d}" for x in range(stations)]
+
+
+def gen_rfid_ids(cards: int) -> list:
+    """
+    rfid card ids
+    :param cards: number of cards
+    :return: list of card ids
+    """
+    return [f"{0x4a3b2c10 + x:08x}" for x in range(cards)]
+
+
+def gen_charge_lines(rows: int, stations: int = 8, cards: int = 50,
+                     start: datetime = datetime(2022, 1, 1),
+                     interval: timedelta = timedelta(minutes=7),
+                     first: int = 0, open_sessions: int = 0, last: int = None):
+    """
+    charge export csv lines, newest session first like the wallbox export
+    :param rows: number of charge sessions
+    :param stations: number of wallboxes
+    :param cards: number of rfid cards
+    :param start: start of the first charge session
+    :param interval: time between two charge session starts
+    :param first: skip older sessions, number of the first exported session
+    :param open_sessions: newest sessions without End and closing values (still charging)
+    :param last: skip newer sessions, number after the last exported session
+    :return: generator(csv line without line break), header first
+    """
+    serials = gen_serials(stations)
+    rfids = gen_rfid_ids(cards)
+    yield CHARGE_HEADER
+    for number in reversed(range(first, rows if last is None else min(last, rows))):
+        date_start = start + interval * number
+        date_end = date_start + timedelta(minutes=95)
+        meter_start = number * 11.4
+        if number >= rows - open_sessions:
+            yield (
+                f"{number % stations + 1};{serials[number % stations]};{rfids[number % cards]};"
+                f"CHARGING;{date_start.strftime(DATE_FORMAT)};;;{meter_start:.1f};;"
+            )
+            continue
+        yield (
+            f"{number % stations + 1};{serials[number % stations]};{rfids[number % cards]};"
+            f"CLOSED;{date_start.strftime(DATE_FORMAT)};{date_end.strftime(DATE_FORMAT)};5700;"
+            f"{meter_start:.1f};{meter_start + 11.4:.1f};11.40"
+        )
+
+
+def gen_charge_csv(rows: int, **kwargs) -> str:
+    """
+    charge export csv content
+    :param rows: number of charge sessions
+    :param kwargs: see gen_charge_lines
+    :return: csv content with header
+    """
+    return "\n".join(gen_charge_lines(rows, **kwargs)) + "\n"
+
+
+def gen_rfid_cards(cards: int, stations: int = 8) -> list:
+    """
+    /chargingtokens response
+    :param cards: number of cards
+    :param stations: number of wallboxes
+    :return: list of rfid card dicts
+    """
+    changed = int(datetime(2022, 6, 20).timestamp() * 1000)
+    return [{
+        "id": card_id,
+        "status": "ENABLED",
+        "serialNumbers": gen_serials(stations),
+        "name": f"Card {number}",
+        "master": number == 0,
+        "changedDate": changed,
+        "usedDate": changed + number * 60000,
+        "expiryDate": None
+    } for number, card_id in enumerate(gen_rfid_ids(cards))]
+
+
+def gen_meter(rng: random.Random = random) -> dict:
+    """
+    live meter values of a wallbox
+    :param rng: random generator
+    :return: meter dict
+    """
+    current = rng.randint(0, 16000)
+    return {
+        "meterValue": rng.randint(1000000, 9000000),
+        "totalActivePower": current * 3 * 230 // 1000,
+        "totalPowerFactor": 1000,
+        "phasesSupported": 3,
+        "currentOffered": 16000,
+        "temperature": rng.randint(150, 450),
+        "lines": [
+            {"socketPhase": phase, "current": current, "voltage": rng.randint(225, 235)}
+            for phase in ("L1", "L2", "L3")
+        ]
+    }
+
+
+def gen_stations(stations: int, rng: random.Random = random) -> list:
+    """
+    /wallboxes response
+    :param stations: number of wallboxes
+    :param rng: random generator
+    :return: list of station dicts
+    """
+    return [{
+        "number": number + 1,
+        "serialNumber": serial,
+        "maxPhases": 3,
+        "maxCurrent": 16000,
+        "phaseUsed": "L1",
+        "macAddress": f"00:60:b5:00:00:{number:02x}",
+        "ipAddress": f"192.168.1.{10 + number}",
+        "state": "READY",
+        "hasExternalMeter": False,
+        "authorizationEnabled": True,
+        "alias": f"Wallbox {number + 1}",
+        "model": "KC-P30-EC2404B2-M0R",
+        "x2active": False,
+        "vehiclePlugged": False,
+        "meter": gen_meter(rng)
+    } for number, serial in enumerate(gen_serials(stations))]
@@ -1,18 +1,56 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """KEBA Download Charge Report from WebUI"""
+import os
 import sys
 import json
+import time
+import atexit
 import argparse
-
-# custom modules
-from lib import crud
-from lib import keba
+import importlib
+from datetime import date, datetime, timedelta
+from contextlib import nullcontext
 
 __author__ = 'Frank Hofmann'
 __version__ = '20240101'
 __app_desc__ = f'Keba Importer v{__version__}'
 
+# re-export charges ending shortly before the watermark, e.g. after a wallbox clock change,
+# sessions in progress are re-exported from their start, see charge_since
+WATERMARK_OVERLAP = timedelta(hours=1)
+
+# days per charge export of a backfill
+BACKFILL_WINDOW = 30
+
+
+def parse_period(period: str) -> tuple[date, date]:
+    """
+    parse report period: 2024, 2024-05, 2024-05-13 or FROM:UNTIL of these, both included
+    2024-05 -> (2024-05-01, 2024-06-01)
+    :param period: period string
+    :return: tuple (first day, day after the period)
+    """
+    def period_range(value: str) -> tuple[date, date]:
+        parts = [int(x) for x in value.split("-")]
+        if len(parts) == 1:
+            return date(parts[0], 1, 1), date(parts[0] + 1, 1, 1)
+        if len(parts) == 2:
+            first = date(parts[0], parts[1], 1)
+            return first, (first + timedelta(days=31)).replace(day=1)
+        first = date(*parts)
+        return first, first + timedelta(days=1)
+
+    try:
+        since_text, _, until_text = period.partition(":")
+        since, until = period_range(since_text)
+        if until_text:
+            until = period_range(until_text)[1]
+    except (TypeError, ValueError) as error:
+        raise argparse.ArgumentTypeError(f"invalid period: {period}") from error
+    if since >= until:
+        raise argparse.ArgumentTypeError(f"empty period: {period}")
+    return since, until
+
 
 def load_arguments(description: str, version: str):
     """
@@ -27,7 +65,21 @@ def load_arguments(description: str, version: str):
     )
     # optional parameters
     parser.add_argument('-c', '--charge',
-                        help='import charge sessions from last 45 days', action="store_true"
+                        help='import new charge sessions since the last import', action="store_true"
+                        )
+    parser.add_argument('-f', '--full',
+                        help='ignore last import, import charge sessions from last 45 days',
+                        action="store_true"
+                        )
+    parser.add_argument('--since', type=datetime.fromisoformat, metavar='DATE',
+                        help='backfill charge sessions from DATE (2022-01-01), '
+                             'resumes interrupted runs'
+                        )
+    parser.add_argument('--until', type=datetime.fromisoformat, metavar='DATE',
+                        help='backfill: end of the backfill (default: end of the window with now)'
+                        )
+    parser.add_argument('--window', type=float, metavar='DAYS',
+                        help=f'backfill: days per charge export (default: {BACKFILL_WINDOW})'
                         )
     parser.add_argument('-r', '--rfid',
                         help='import rfid cards', action="store_true"
@@ -35,12 +87,108 @@ def load_arguments(description: str, version: str):
     parser.add_argument('-s', '--station',
                         help='import wallbox stations', action="store_true"
                         )
+    parser.add_argument('-p', '--prune',
+                        help='delete rfid cards and stations missing on the wallbox',
+                        action="store_true"
+                        )
     parser.add_argument('-w', '--write',
-                        help='write reports to json files', action="store_true"
+                        help='write reports to ndjson files', action="store_true"
+                        )
+    parser.add_argument('--output-dir', metavar='DIR',
+                        help='write: directory of the report files '
+                             '(default: KEBA_OUTPUT_DIR or /tmp)'
+                        )
+    parser.add_argument('--compress', choices=['none', 'gzip', 'zstd'], default='none',
+                        help='write: compression of the report files (default: none)'
                         )
     parser.add_argument("-a", "--all",
                         help="full import charges, stations, rfid cards", action="store_true"
                         )
+    parser.add_argument('--pipeline',
+                        help='overlap wallbox fetches and database writes, not with --since',
+                        action="store_true"
+                        )
+    parser.add_argument('--fetch-workers', type=int, default=1, metavar='N',
+                        help='pipeline: concurrent requests to the wallbox (default: 1)'
+                        )
+    parser.add_argument('--fleet', metavar='FILE',
+                        help='import from all wallboxes in json file concurrently'
+                        )
+    parser.add_argument('--workers', type=int, default=4,
+                        help='wallboxes fetched at the same time in fleet mode (default: 4)'
+                        )
+    parser.add_argument('-d', '--daemon',
+                        help='keep running, import the selected reports on their intervals',
+                        action="store_true"
+                        )
+    parser.add_argument('--charge-interval', type=float, default=900, metavar='SEC',
+                        help='daemon: seconds between charge imports (default: 900)'
+                        )
+    parser.add_argument('--rfid-interval', type=float, default=3600, metavar='SEC',
+                        help='daemon: seconds between rfid card imports (default: 3600)'
+                        )
+    parser.add_argument('--station-interval', type=float, default=3600, metavar='SEC',
+                        help='daemon: seconds between station imports (default: 3600)'
+                        )
+    parser.add_argument('--jitter', type=float, default=0.1,
+                        help='daemon: random part of the intervals (default: 0.1 = +/-10%%)'
+                        )
+    parser.add_argument('--telemetry', type=float, default=0, metavar='SEC',
+                        help='daemon: sample live meter values every SEC seconds (default: off)'
+                        )
+    parser.add_argument('--telemetry-resolution', type=int, default=60, metavar='SEC',
+                        help='daemon: seconds per stored meter sample (default: 60)'
+                        )
+    parser.add_argument('--telemetry-flush', type=float, default=300, metavar='SEC',
+                        help='daemon: seconds between meter sample writes (default: 300)'
+                        )
+    parser.add_argument('-n', '--no-db',
+                        help='fetch reports without database import, use with -w',
+                        action="store_true"
+                        )
+    parser.add_argument('-m', '--migrate',
+                        help='set up and migrate database schema', action="store_true"
+                        )
+    parser.add_argument('--rebuild-rollups',
+                        help='recreate consumption rollups from all charges', action="store_true"
+                        )
+    parser.add_argument('--partitions',
+                        help='MySQL/MariaDB: partition charges by month, create the coming '
+                             'partitions and apply --retention',
+                        action="store_true"
+                        )
+    parser.add_argument('--retention', type=int, metavar='MONTHS',
+                        help='partitions: archive and drop charges of months before the last '
+                             'MONTHS months (default: DB_RETENTION_MONTHS, 0 = keep all)'
+                        )
+    parser.add_argument('--retention-dir', metavar='DIR',
+                        help='partitions: directory of the archived charges '
+                             '(default: DB_RETENTION_DIR)'
+                        )
+    parser.add_argument('--report', type=parse_period, metavar='PERIOD',
+                        help='print consumption per rfid card and station, '
+                             'PERIOD: 2024, 2024-05, 2024-05-13 or FROM:UNTIL'
+                        )
+    parser.add_argument('--card', metavar='RFID',
+                        help='report: only this rfid card'
+                        )
+    parser.add_argument('--archive', metavar='DIR',
+                        help='store raw wallbox responses compressed in DIR (default: KEBA_ARCHIVE)'
+                        )
+    parser.add_argument('--replay',
+                        help='import the archived responses into the database, no wallbox needed',
+                        action="store_true"
+                        )
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='write stage timings and counters as prometheus textfile'
+                        )
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write a cProfile of the run, read with: python -m pstats FILE'
+                        )
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='log level, INFO logs the metrics summary '
+                             '(default: INFO with --daemon, else WARNING)'
+                        )
     parser.add_argument('-v', '--version',
                         help='show program version', action="store_true"
                         )
@@ -52,25 +200,602 @@ def load_arguments(description: str, version: str):
     return args
 
 
-def write_json_file(content, file_name) -> bool:
+def lib_module(name: str):
     """
-    write list of dicts to json file
-    :param content:
-    :param file_name:
-    :return:
+    lib module, imported on first use to keep -h/-v fast
+    lib/__init__ reads .env and adds lib to sys.path, the lib modules import each other by
+    module name, so they are imported by module name here as well to load each module only once
+    :param name: module name, e.g. keba
+    :return: module
     """
-    with open(file_name, 'w', encoding="utf-8") as outfile:
-        json.dump(content, outfile)
-    return True
+    import lib  # pylint: disable=import-outside-toplevel,unused-import
+    return importlib.import_module(name)
 
 
-if __name__ == "__main__":
+def report_writer(args, name: str):
+    """
+    ndjson report file in the output directory
+    :param args: namespace from parsed arguments
+    :param name: file name without extension, e.g. keba_charges
+    :return: NdjsonWriter, use as context manager
+    """
+    report_file = lib_module("report_file")
+    return report_file.NdjsonWriter(args.output_dir, name, compression=args.compress)
+
+
+def write_report(args, name: str, records: list) -> None:
+    """
+    write a complete report as ndjson file
+    :param args: namespace from parsed arguments
+    :param name: file name without extension
+    :param records: list of dict
+    """
+    with report_writer(args, name) as writer:
+        for record in records:
+            writer.write(record)
+
+
+def print_report(args, db_session) -> None:
+    """
+    print consumption per rfid card and station of the report period
+    :param args: namespace from parsed arguments
+    :param db_session: KebaDB or KebaParquetStore
+    """
+    since, until = args.report
+    report = db_session.consumption_report(since, until, rfid=args.card)
+    print(f"consumption {since} - {until - timedelta(days=1)}")
+    print(f"{'rfid':20} {'station':>8} {'sessions':>9} {'kWh':>12}")
+    for (rfid, station_id), (consumption, sessions) in sorted(report.items()):
+        print(f"{rfid:20} {station_id:8} {sessions:9} {consumption:12,.2f}")
+    print(f"{'total':20} {'':8} {sum(x[1] for x in report.values()):9} "
+          f"{sum(x[0] for x in report.values()):12,.2f}")
+
+
+def count_changes(host: str, name: str, changes: dict) -> None:
+    """
+    count the result of a sync as metrics
+    :param host: wallbox hostname
+    :param name: dataset name, e.g. rfid
+    :param changes: dict of changes, see KebaDB.sync
+    """
+    registry = lib_module("metrics").registry
+    for change in ("inserted", "updated", "deleted"):
+        registry.count(host, f"{name}_{change}", len(changes[change]))
+    registry.count(host, f"{name}_unchanged", changes["unchanged"])
+
+
+def write_metrics(args, log: bool = True) -> None:
+    """
+    log the metrics summary and write the prometheus textfile
+    :param args: namespace from parsed arguments
+    :param log: False to write the prometheus textfile only
+    """
+    registry = lib_module("metrics").registry
+    if log:
+        registry.log_summary()
+    if args.metrics:
+        registry.write_prometheus(args.metrics)
+
+
+def import_rfid(args, keba_session, db_session, archive=None) -> None:
+    """
+    import rfid cards, skipped if the payload equals the last imported one
+    :param args: namespace from parsed arguments
+    :param keba_session: KebaWallbox
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param archive: RawArchive for the raw response, None to disable
+    """
+    store_rfid(args, keba_session.hostname, fetch_rfid(keba_session, archive), db_session)
+
+
+def fetch_rfid(keba_session, archive=None) -> bytes:
+    """
+    download rfid cards
+    :param keba_session: KebaWallbox
+    :param archive: RawArchive for the raw response, None to disable
+    :return: raw json response
+    """
+    registry = lib_module("metrics").registry
+    host = keba_session.hostname
+    with registry.stage(host, "rfid_fetch"):
+        content = keba_session.get_rfid().content
+    if archive:
+        archive.store(host, "rfid", content)
+    return content
+
+
+def store_rfid(args, host, content, db_session) -> None:
+    """
+    write and sync rfid cards, skipped if the payload equals the last imported one
+    :param args: namespace from parsed arguments
+    :param host: wallbox hostname
+    :param content: raw json response
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    """
+    keba = lib_module("keba")
+    registry = lib_module("metrics").registry
+    digest = lib_module("archive").payload_digest(content)
+    # -w, -f and -p always import
+    skip = db_session and not (args.write or args.full or args.prune)
+    if skip and db_session.get_digest(f"{host}/rfid") == digest:
+        registry.count(host, "rfid_payload_unchanged")
+        return
+
+    rfid_cards = keba.parse_rfids(json.loads(content))
+    if args.write:
+        write_report(args, "keba_rfids", rfid_cards)
+    if db_session:
+        with registry.stage(host, "rfid_store"):
+            changes = db_session.sync_rfid_cards(rfid_cards, delete_missing=args.prune)
+        count_changes(host, "rfid", changes)
+        db_session.set_digest(f"{host}/rfid", digest)
+
+
+def import_charges(args, keba_session, db_session, archive=None) -> None:
+    """
+    import wallbox charges since the watermark
+    :param args: namespace from parsed arguments
+    :param keba_session: KebaWallbox
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param archive: RawArchive for the raw csv export, None to disable
+    """
+    host = keba_session.hostname
+    since = charge_since(args, host, db_session)
+    # the export is archived while it is imported, incomplete downloads are discarded
+    with archive.writer(host, "charges", since=since) if archive else nullcontext() as raw_sink:
+        import_charge_export(args, keba_session, db_session, since, raw_sink)
+
+
+def charge_since(args, host, db_session):
+    """
+    start of the charge export: the watermark less WATERMARK_OVERLAP or the start of the
+    oldest session in progress, if it is older
+    :param args: namespace from parsed arguments, -f ignores the watermark
+    :param host: wallbox hostname
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :return: datetime or None for the default window
+    """
+    if not db_session or args.full:
+        return None
+    watermark = db_session.get_watermark(host)
+    if not watermark:
+        return None
+    open_since = db_session.get_open_since(host)
+    since = watermark - WATERMARK_OVERLAP
+    return min(since, open_since) if open_since else since
+
+
+def backfill_charges(args, keba_session, db_session, archive=None) -> None:
+    """
+    import charges of a long period with one export per window
+    completed windows are checkpointed, an interrupted backfill continues with the open windows
+    :param args: namespace from parsed arguments
+    :param keba_session: KebaWallbox
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param archive: RawArchive for the raw csv exports, None to disable
+    """
+    keba = lib_module("keba")
+    host = keba_session.hostname
+    completed = db_session.get_backfill_windows(host) if db_session else []
+    window = timedelta(days=args.window or BACKFILL_WINDOW)
+    if args.until:
+        windows = keba.gen_windows(args.since, args.until, window)
+    else:
+        # whole windows, the last one ends after now and is the same when the backfill resumes
+        windows = [(x, x + window) for x, _ in keba.gen_windows(args.since, datetime.now(), window)]
+    for since, until in windows:
+        if any(x[0] <= since and until <= x[1] for x in completed):
+            continue
+        with archive.writer(host, "charges", since=since, until=until) if archive \
+                else nullcontext() as raw_sink:
+            inserted, skipped = import_charge_export(
+                args, keba_session, db_session, since, raw_sink, until=until,
+                output=f"keba_charges_{since:%Y%m%d}"
+            )
+        if db_session:
+            db_session.complete_backfill_window(host, since, until, inserted, skipped)
+        print(f"{host} {since} - {until}: {inserted} new/{skipped} known charges")
+
+
+def import_charge_export(args, keba_session, db_session, since, raw_sink,
+                         until=None, output="keba_charges") -> tuple[int, int]:
+    """
+    export, download and import charges
+    :param args: namespace from parsed arguments
+    :param keba_session: KebaWallbox
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param since: export start, None for the default window
+    :param raw_sink: ArchiveWriter or None
+    :param until: export end, None for now
+    :param output: report file name with -w
+    :return: tuple (inserted, skipped), (0, 0) without database
+    """
+    charges = lib_module("metrics").TimedIterator(
+        keba_session.iter_charges(since=since, until=until, raw_sink=raw_sink)
+    )
+    if not args.write:
+        return store_charges(keba_session.hostname, db_session, charges)
+    # the report file is written while the charges are imported
+    with report_writer(args, output) as writer:
+        if db_session:
+            return store_charges(keba_session.hostname, db_session, charges, writer.tee(charges))
+        for charge in charges:
+            writer.write(charge)
+    return 0, 0
+
+
+def store_charges(host, db_session, charges, charge_report=None) -> tuple[int, int]:
+    """
+    insert charges, the time of the export is not counted as charge_store
+    :param host: wallbox hostname
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param charges: TimedIterator of the charge export
+    :param charge_report: iterable consumed instead of charges, e.g. NdjsonWriter.tee(charges)
+    :return: tuple (inserted, skipped), (0, 0) without database
+    """
+    registry = lib_module("metrics").registry
+    if charge_report is None:
+        charge_report = charges
+    if db_session:
+        fetch_seconds = charges.seconds
+        started = time.perf_counter()
+        inserted, skipped = db_session.insert_charges(charge_report, state_key=host)
+        # export, download and parsing ran while insert_charges consumed the charges
+        registry.add_time(
+            host, "charge_store", time.perf_counter() - started - (charges.seconds - fetch_seconds)
+        )
+        registry.count(host, "charges_inserted", inserted)
+        registry.count(host, "charges_skipped", skipped)
+        return inserted, skipped
+    return 0, 0
+
+
+def store_charge_feed(args, host, db_session, feed) -> tuple[int, int]:
+    """
+    insert and write charges of a pipelined export
+    waits for the wallbox are not counted as charge_store
+    :param args: namespace from parsed arguments
+    :param host: wallbox hostname
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param feed: BatchFeed of the charge export
+    :return: tuple (inserted, skipped), (0, 0) without database
+    """
+    registry = lib_module("metrics").registry
+    with report_writer(args, "keba_charges") if args.write else nullcontext() as writer:
+        charge_report = writer.tee(feed) if writer else feed
+        if not db_session:
+            for _ in charge_report:
+                pass
+            return 0, 0
+        started = time.perf_counter()
+        inserted, skipped = db_session.insert_charges(charge_report, state_key=host)
+        registry.add_time(host, "charge_store", time.perf_counter() - started - feed.get_wait)
+    registry.count(host, "charges_inserted", inserted)
+    registry.count(host, "charges_skipped", skipped)
+    return inserted, skipped
+
+
+def import_stations(args, keba_session, db_session, archive=None) -> None:
+    """
+    import wallbox stations, skipped if the stations (without live meter values) are unchanged
+    :param args: namespace from parsed arguments
+    :param keba_session: KebaWallbox
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param archive: RawArchive for the raw response, None to disable
+    """
+    store_stations(
+        args, keba_session.hostname, fetch_stations(keba_session, archive), db_session
+    )
+
+
+def fetch_stations(keba_session, archive=None) -> bytes:
+    """
+    download wallbox stations
+    :param keba_session: KebaWallbox
+    :param archive: RawArchive for the raw response, None to disable
+    :return: raw json response
+    """
+    registry = lib_module("metrics").registry
+    host = keba_session.hostname
+    with registry.stage(host, "station_fetch"):
+        content = keba_session.get_station().content
+    if archive:
+        archive.store(host, "stations", content)
+    return content
+
+
+def store_stations(args, host, content, db_session) -> None:
+    """
+    write and sync wallbox stations, skipped if they are unchanged apart from live meter values
+    :param args: namespace from parsed arguments
+    :param host: wallbox hostname
+    :param content: raw json response
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    """
+    keba = lib_module("keba")
+    registry = lib_module("metrics").registry
+    stations = json.loads(content)
+    digest = lib_module("archive").records_digest(stations, ignore=("meter",))
+    skip = db_session and not (args.write or args.full or args.prune)
+    if skip and db_session.get_digest(f"{host}/stations") == digest:
+        registry.count(host, "station_payload_unchanged")
+        return
+
+    station_report = keba.parse_stations(stations)
+    if args.write:
+        write_report(args, "keba_stations", station_report)
+    if db_session:
+        with registry.stage(host, "station_store"):
+            changes = db_session.sync_stations(station_report, delete_missing=args.prune)
+        count_changes(host, "station", changes)
+        db_session.set_digest(f"{host}/stations", digest)
+
+
+def import_pipelined(args, keba_session, db_session, archive=None) -> None:
+    """
+    import the selected datasets with overlapping wallbox fetches and database writes
+    the wallbox is read by up to --fetch-workers threads, charges are handed over in batches
+    through a bounded queue, the database is written by this thread, one commit per dataset
+    :param args: namespace from parsed arguments
+    :param keba_session: KebaWallbox
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param archive: RawArchive for raw responses, None to disable
+    """
+    from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+    pipeline = lib_module("pipeline")
+    registry = lib_module("metrics").registry
+
+    host = keba_session.hostname
+    timer = pipeline.RunTimer(registry, host)
+    feed = pipeline.BatchFeed() if args.charge else None
+    since = charge_since(args, host, db_session) if args.charge else None
+    # the pool is shut down before the archived export is closed
+    with archive.writer(host, "charges", since=since) if archive and feed \
+            else nullcontext() as raw_sink, \
+            ThreadPoolExecutor(max_workers=args.fetch_workers, thread_name_prefix="fetch") as pool:
+        try:
+            # charges are submitted first, with a single worker the other fetches wait for them
+            producer = pool.submit(
+                feed.produce, keba_session.iter_charges(since=since, raw_sink=raw_sink)
+            ) if feed else None
+            rfid = pool.submit(fetch_rfid, keba_session, archive) if args.rfid else None
+            stations = pool.submit(fetch_stations, keba_session, archive) \
+                if args.station else None
+            if feed:
+                store_charge_feed(args, host, db_session, feed)
+                producer.result()
+            if rfid:
+                store_rfid(args, host, rfid.result(), db_session)
+            if stations:
+                store_stations(args, host, stations.result(), db_session)
+        finally:
+            if feed:
+                # stop the producer after a failed import
+                feed.cancelled.set()
+    timer.stop(feed)
+
+
+def run_daemon(args, keba_session, db_session, archive=None) -> None:
+    """
+    run the selected imports on their intervals until SIGTERM
+    the wallbox session and database pool stay open between the runs
+    :param args: namespace from parsed arguments
+    :param keba_session: KebaWallbox
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param archive: RawArchive for raw responses, None to disable
+    """
+    daemon = lib_module("daemon")
+    telemetry = lib_module("telemetry")
+
+    jobs, intervals = {}, {}
+    for name, selected, interval, function in (
+            ("rfid", args.rfid, args.rfid_interval, import_rfid),
+            ("charge", args.charge, args.charge_interval, import_charges),
+            ("station", args.station, args.station_interval, import_stations)):
+        if selected:
+            jobs[name] = lambda function=function: function(args, keba_session, db_session, archive)
+            intervals[name] = interval
+
+    collector = None
+    if args.telemetry:
+        collector = telemetry.TelemetryCollector(
+            keba_session, db_session, resolution=args.telemetry_resolution
+        )
+        jobs["telemetry"] = collector.poll
+        intervals["telemetry"] = args.telemetry
+        jobs["telemetry flush"] = collector.flush
+        intervals["telemetry flush"] = args.telemetry_flush
+
+    def on_error(_name, _error):
+        """reset the database transaction of a failed job"""
+        if db_session:
+            db_session.rollback()
+
+    try:
+        daemon.KebaDaemon(
+            jobs, intervals, jitter=args.jitter, on_error=on_error,
+            # frequent jobs (e.g. telemetry) log at DEBUG only, the same for their summary
+            on_finish=lambda name: write_metrics(args, log=intervals[name] >= 60)
+        ).run()
+    finally:
+        if collector:
+            collector.flush(final=True)
+        keba_session.close()
+        if db_session:
+            db_session.close()
+
+
+def replay_archive(args, archive, db_session) -> None:
+    """
+    import archived raw responses without wallbox connection
+    all charge exports in order of archiving, the latest rfid cards and stations of each wallbox
+    :param args: namespace from parsed arguments, -c/-r/-s select the datasets
+    :param archive: RawArchive
+    :param db_session: KebaDB or KebaParquetStore
+    """
+    keba = lib_module("keba")
+    latest = {}
+    for entry in archive.entries():
+        if entry["dataset"] != "charges":
+            latest[(entry["host"], entry["dataset"])] = entry
+            continue
+        if not args.charge:
+            continue
+        with archive.open_text(entry["digest"]) as lines:
+            inserted, skipped = db_session.insert_charges(
+                keba.parse_charges(lines), state_key=entry["host"]
+            )
+        print(f"{entry['time']} {entry['host']} charges: {inserted} new/{skipped} known")
+
+    for (host, dataset), entry in latest.items():
+        records = json.loads(archive.read(entry["digest"]))
+        if dataset == "rfid" and args.rfid:
+            changes = db_session.sync_rfid_cards(keba.parse_rfids(records))
+        elif dataset == "stations" and args.station:
+            changes = db_session.sync_stations(keba.parse_stations(records))
+        else:
+            continue
+        print(f"{entry['time']} {host} {dataset}: {len(changes['inserted'])} new/"
+              f"{len(changes['updated'])} updated/{changes['unchanged']} unchanged")
+
+
+def import_fleet(args, db_session, archive=None) -> bool:
+    """
+    fetch reports from many wallboxes concurrently and import them in one database session
+    the charge exports are spooled to temporary files and imported one wallbox at a time
+    :param args: namespace from parsed arguments
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param archive: RawArchive for the raw responses, None to disable
+    :return: True if all wallboxes succeeded
+    """
+    fleet = lib_module("fleet")
+    registry = lib_module("metrics").registry
+
+    # the report files have one name per report, the wallboxes would overwrite each other
+    if args.write:
+        raise SystemExit(
+            "ErrorConfig: -w is not supported with --fleet, use a database or --archive"
+        )
+
+    hosts = fleet.load_fleet(args.fleet)
+    since = None
+    if args.charge:
+        since = {x["hostname"]: charge_since(args, x["hostname"], db_session) for x in hosts}
+
+    results = fleet.KebaFleet(hosts, max_workers=args.workers, archive=archive).fetch(
+        charge_since=since, rfid=args.rfid, station=args.station
+    )
+
+    imported = {}
+    try:
+        if db_session:
+            for result in results:
+                if not result.error:
+                    with registry.stage(result.hostname, "charge_store"):
+                        imported[result.hostname] = db_session.insert_charges(
+                            result.iter_charges(), state_key=result.hostname
+                        )
+                    inserted, skipped = imported[result.hostname]
+                    registry.count(result.hostname, "charges_inserted", inserted)
+                    registry.count(result.hostname, "charges_skipped", skipped)
+                result.close()
+
+            # rfid cards and stations of all wallboxes are synced together,
+            # missing entries are only deleted if every wallbox answered
+            succeeded = [x for x in results if not x.error]
+            prune = args.prune and len(succeeded) == len(results)
+            if args.rfid:
+                db_session.sync_rfid_cards(
+                    [x for result in succeeded for x in result.rfids], delete_missing=prune
+                )
+            if args.station:
+                db_session.sync_stations(
+                    [x for result in succeeded for x in result.stations], delete_missing=prune
+                )
+    finally:
+        for result in results:
+            result.close()
+
+    print(fleet.summary(results, imported))
+    return not any(x.error for x in results)
+
+
+def run_tasks(args) -> None:
+    """
+    database tasks before the imports: migration, rollups, partitions and consumption report
+    :param args: namespace from parsed arguments
+    """
+    crud = lib_module("crud")
+
+    # Set Up/Migrate Database Schema
+    if args.migrate:
+        crud.open_database().setup()
+
+    # Rebuild Consumption Rollups
+    if args.rebuild_rollups:
+        crud.open_database().rebuild_rollups()
+
+    # Charge Partitions and Retention
+    if args.partitions:
+        partitions = crud.open_database().maintain_partitions(
+            ahead=int(os.environ.get("DB_PARTITION_AHEAD", 3)),
+            keep_months=args.retention if args.retention is not None
+            else int(os.environ.get("DB_RETENTION_MONTHS", 0)),
+            archive_dir=args.retention_dir or os.environ.get("DB_RETENTION_DIR")
+        )
+        print(f"partitions created: {', '.join(partitions['created']) or '-'}, "
+              f"archived and dropped: {', '.join(partitions['dropped']) or '-'}")
+
+    # Consumption Report
+    if args.report:
+        print_report(args, crud.open_database())
+
+
+def run_imports(args, keba_session, db_session, archive=None) -> None:
+    """
+    import the selected datasets of one wallbox: daemon, pipelined or one after another
+    :param args: namespace from parsed arguments
+    :param keba_session: KebaWallbox
+    :param db_session: KebaDB or KebaParquetStore, None to fetch only
+    :param archive: RawArchive for raw responses, None to disable
+    """
+    # Daemon Mode
+    if args.daemon:
+        run_daemon(args, keba_session, db_session, archive)
+        return
+
+    # Pipelined Import
+    if args.pipeline and not args.since:
+        import_pipelined(args, keba_session, db_session, archive)
+        return
+
+    if args.rfid:
+        import_rfid(args, keba_session, db_session, archive)
+    if args.charge and args.since:
+        backfill_charges(args, keba_session, db_session, archive)
+    elif args.charge:
+        import_charges(args, keba_session, db_session, archive)
+    if args.station:
+        import_stations(args, keba_session, db_session, archive)
+
+
+def main() -> None:
+    """run the tasks and imports selected by the cli arguments"""
     param = load_arguments(__app_desc__, __version__)
 
-    # initialize wallbox and database session
-    # read configuration from .env
-    keba_session = keba.KebaWallbox()
-    db = crud.KebaDB()
+    # custom modules, imported after argument parsing to keep -h/-v fast
+    import logging  # pylint: disable=import-outside-toplevel
+    crud = lib_module("crud")
+    keba = lib_module("keba")
+
+    logging.basicConfig(
+        level=param.log_level or ("INFO" if param.daemon else "WARNING"),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    if param.profile:
+        lib_module("metrics").start_profile(param.profile)
+
+    run_tasks(param)
 
     # Full Import
     if param.all:
@@ -78,27 +803,47 @@ if __name__ == "__main__":
         param.charge = True
         param.station = True
 
-    # Import RFID Cards
-    if param.rfid:
-        rfid_cards = keba_session.read_rfids()
-        if param.write:
-            write_json_file(rfid_cards, "/tmp/keba_rfids.json")
-        for x in rfid_cards:
-            db.insert_rfid_card(x)
-
-    # Import Wallbox Charges
-    if param.charge:
-        charge_report = keba_session.read_charges()
-        if param.write:
-            write_json_file(charge_report, "/tmp/keba_charges.json")
-        for x in charge_report:
-            db.insert_charge(x)
-
-    # Import Wallbox Stations
-    if param.station:
-        station_report = keba_session.read_stations()
-        if param.write:
-            write_json_file(station_report, "/tmp/keba_stations.json")
-        for x in station_report:
-            db.insert_station(x)
+    # Backfill imports charges, fleet and daemon imports run from the watermark
+    if (param.until or param.window) and not param.since:
+        raise SystemExit("ErrorConfig: --until and --window need --since")
+    if param.since and (param.fleet or param.daemon):
+        raise SystemExit("ErrorConfig: --since is not supported with --fleet or --daemon")
+    if param.since:
+        param.charge = True
+
+    # initialize wallbox and database session
+    # read configuration from .env, the database is connected on first use
+    db = None if param.no_db else crud.open_database()
+
+    # Report Files of -w, the directory is read from .env if not set
+    param.output_dir = param.output_dir or os.environ.get("KEBA_OUTPUT_DIR", "/tmp")
+    if param.write and param.compress == "zstd":
+        # fail before anything is fetched
+        lib_module("report_file").zstd_open()
+
+    # Raw Response Archive, the directory is read from .env if not set
+    archive_dir = param.archive or os.environ.get("KEBA_ARCHIVE")
+    raw_archive = lib_module("archive").RawArchive(archive_dir) if archive_dir else None
+    if param.replay:
+        if not raw_archive or not db:
+            raise SystemExit(
+                "ErrorConfig: --replay needs an archive (--archive or KEBA_ARCHIVE) and a database"
+            )
+        replay_archive(param, raw_archive, db)
+        sys.exit(0)
 
+    # metrics of one-shot and fleet runs are written on exit, also after errors
+    if not param.daemon:
+        atexit.register(write_metrics, param)
+
+    # Fleet Import
+    if param.fleet:
+        sys.exit(0 if import_fleet(param, db, raw_archive) else 1)
+
+    if not (param.rfid or param.charge or param.station or (param.daemon and param.telemetry)):
+        sys.exit(0)
+    run_imports(param, keba.KebaWallbox(), db, raw_archive)
+
+
+if __name__ == "__main__":
+    main()
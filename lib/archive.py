@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Raw Response Archive for KEBA Reporter
+wallbox responses are stored gzip compressed and addressed by the sha256 of their content:
+<path>/objects/ab/abcdef....gz, every stored response is listed in <path>/index.jsonl
+"""
+import os
+import json
+import gzip
+import uuid
+import hashlib
+import threading
+from datetime import datetime
+
+
+def payload_digest(content: bytes) -> str:
+    """
+    sha256 of a raw response
+    :param content: response body
+    :return: hex digest
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def records_digest(records: list, ignore: tuple = ()) -> str:
+    """
+    sha256 of json records without volatile keys, e.g. live meter values of stations
+    :param records: list of dict
+    :param ignore: keys left out
+    :return: hex digest
+    """
+    content = json.dumps(
+        [{k: v for k, v in x.items() if k not in ignore} for x in records],
+        sort_keys=True, separators=(",", ":")
+    )
+    return payload_digest(content.encode())
+
+
+class ArchiveWriter:
+    """stream a response into the archive, the object is stored when the writer is closed"""
+
+    def __init__(self, archive: "RawArchive", host: str, dataset: str, meta: dict) -> None:
+        """
+        init class definition
+        :param archive: target archive
+        :param host: wallbox hostname
+        :param dataset: charges, rfid or stations
+        :param meta: additional index fields, e.g. export start
+        """
+        self.archive = archive
+        self.entry = {"host": host, "dataset": dataset, **meta}
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.tmp_file = os.path.join(archive.path, f"tmp-{uuid.uuid4().hex}.gz")
+        os.makedirs(archive.path, exist_ok=True)
+        self.file = gzip.open(self.tmp_file, "wb", compresslevel=6)
+
+    def write(self, data: bytes) -> None:
+        """
+        append response content
+        :param data: bytes
+        """
+        self.hash.update(data)
+        self.size += len(data)
+        self.file.write(data)
+
+    def close(self, store: bool = True):
+        """
+        finish the object, an existing object with the same content is kept
+        :param store: False to discard, e.g. after a failed download
+        :return: sha256 hex digest or None if discarded or empty
+        """
+        self.file.close()
+        if not store or not self.size:
+            os.remove(self.tmp_file)
+            return None
+        digest = self.hash.hexdigest()
+        target = self.archive.object_file(digest)
+        if os.path.exists(target):
+            os.remove(self.tmp_file)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(self.tmp_file, target)
+        self.archive.add_entry(dict(self.entry, digest=digest, size=self.size))
+        return digest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(store=exc_type is None)
+
+
+class RawArchive:
+    """content-addressed, gzip compressed archive of raw wallbox responses"""
+
+    def __init__(self, path: str) -> None:
+        """
+        init class definition
+        :param path: archive directory
+        """
+        self.path = path
+        self.index_file = os.path.join(path, "index.jsonl")
+        self.lock = threading.Lock()
+
+    def object_file(self, digest: str) -> str:
+        """file of an archived object"""
+        return os.path.join(self.path, "objects", digest[:2], f"{digest}.gz")
+
+    def add_entry(self, entry: dict) -> None:
+        """
+        append an entry to the index
+        :param entry: dict with host, dataset, digest, size
+        """
+        entry = {"time": datetime.now().isoformat(sep=" ", timespec="seconds"), **entry}
+        with self.lock, open(self.index_file, 'a', encoding="utf-8") as outfile:
+            outfile.write(json.dumps(entry, default=str) + "\n")
+
+    def writer(self, host: str, dataset: str, **meta) -> ArchiveWriter:
+        """
+        archive a streamed response
+        :param host: wallbox hostname
+        :param dataset: charges, rfid or stations
+        :param meta: additional index fields
+        :return: ArchiveWriter, use as context manager
+        """
+        return ArchiveWriter(self, host, dataset, meta)
+
+    def store(self, host: str, dataset: str, content: bytes, **meta) -> str:
+        """
+        archive a complete response
+        :param host: wallbox hostname
+        :param dataset: charges, rfid or stations
+        :param content: response body
+        :param meta: additional index fields
+        :return: sha256 hex digest
+        """
+        with self.writer(host, dataset, **meta) as writer:
+            writer.write(content)
+        return writer.hash.hexdigest()
+
+    def read(self, digest: str) -> bytes:
+        """
+        content of an archived object
+        :param digest: sha256 hex digest
+        :return: bytes
+        """
+        with gzip.open(self.object_file(digest), "rb") as infile:
+            return infile.read()
+
+    def open_text(self, digest: str):
+        """
+        archived object as text stream, e.g. for line by line parsing of charge exports
+        :param digest: sha256 hex digest
+        :return: text file object
+        """
+        return gzip.open(self.object_file(digest), "rt", encoding="utf-8", newline="")
+
+    def entries(self, host: str = None, dataset: str = None):
+        """
+        archived responses in order of archiving
+        :param host: only this wallbox
+        :param dataset: only this dataset
+        :return: generator(dict of index entry)
+        """
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, 'r', encoding="utf-8") as infile:
+            for line in infile:
+                entry = json.loads(line)
+                if host and entry["host"] != host or dataset and entry["dataset"] != dataset:
+                    continue
+                yield entry
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Keba Importer Daemon: recurring syncs with a warm wallbox session and database pool"""
+import time
+import random
+import signal
+import logging
+import threading
+
+logger = logging.getLogger("keba.daemon")
+
+
+class KebaDaemon:
+    """run sync jobs on independent intervals until SIGTERM/SIGINT"""
+
+    def __init__(self, jobs: dict, intervals: dict, jitter: float = 0.1, on_error=None,
+                 on_finish=None) -> None:
+        """
+        init class definition
+        :param jobs: dict job name -> callable without arguments
+        :param intervals: dict job name -> interval in seconds
+        :param jitter: random part of the interval, 0.1 = +/-10%
+        :param on_error: callable(job name, exception), called after a failed job
+        :param on_finish: callable(job name), called after every job, e.g. to export metrics
+        """
+        self.jobs = jobs
+        self.intervals = intervals
+        self.jitter = jitter
+        self.on_error = on_error
+        self.on_finish = on_finish
+        self.stop_event = threading.Event()
+        self.runs = {name: 0 for name in jobs}
+        self.failures = {name: 0 for name in jobs}
+
+    def next_delay(self, name: str) -> float:
+        """
+        interval of a job with jitter,
+        recurring jobs of many importers don't hit the wallbox together
+        :param name: job name
+        :return: seconds
+        """
+        interval = self.intervals[name]
+        return max(0.0, interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def stop(self, signum=None, _frame=None) -> None:
+        """
+        stop after the running job, used as signal handler
+        :param signum: signal number
+        """
+        if signum:
+            logger.info("received signal %s, shutting down", signal.Signals(signum).name)
+        self.stop_event.set()
+
+    def run_job(self, name: str) -> bool:
+        """
+        run one job, failures are logged and retried on the next interval
+        :param name: job name
+        :return: True on success
+        """
+        started = time.monotonic()
+        self.runs[name] += 1
+        try:
+            self.jobs[name]()
+        # a failing job (wallbox offline, database restart) must not stop the daemon,
+        # the api raises SystemExit on errors
+        except (SystemExit, Exception) as error:  # pylint: disable=broad-except
+            self.failures[name] += 1
+            logger.error("job %s failed after %.1fs: %s", name, time.monotonic() - started, error)
+            if self.on_error:
+                self.on_error(name, error)
+            return False
+        # frequent jobs like telemetry polls would flood the log
+        log = logger.info if self.intervals[name] >= 60 else logger.debug
+        log("job %s finished in %.1fs", name, time.monotonic() - started)
+        return True
+
+    def run(self) -> None:
+        """run all jobs now and then on their intervals until stopped"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info("daemon started: %s", ", ".join(
+            f"{name} every {self.intervals[name]:g}s" for name in self.jobs
+        ))
+
+        due = {name: time.monotonic() for name in self.jobs}
+        while not self.stop_event.is_set():
+            name = min(due, key=due.get)
+            if self.stop_event.wait(max(0.0, due[name] - time.monotonic())):
+                break
+            self.run_job(name)
+            if self.on_finish:
+                self.on_finish(name)
+            due[name] = time.monotonic() + self.next_delay(name)
+        logger.info("daemon stopped")
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=too-few-public-methods
+"""Keba Wallbox Fleet: concurrent reports from many wallboxes"""
+import io
+import json
+import time
+import shutil
+import tempfile
+import threading
+from typing import BinaryIO
+from dataclasses import dataclass, field
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import keba
+
+# KebaWallbox arguments accepted from the fleet file
+FLEET_HOST_KEYS = ("hostname", "username", "password", "proto", "export_timeout")
+
+
+def load_fleet(file_name: str) -> list:
+    """
+    read wallbox hosts and credentials from json file
+    [{"hostname": "192.168.1.1", "username": "admin", "password": "secret"}, ...]
+    missing credentials are taken from the environment (KEBA_USER, KEBA_PASS)
+    :param file_name: fleet json file
+    :return: list(dict of KebaWallbox arguments)
+    """
+    try:
+        with open(file_name, 'r', encoding="utf-8") as infile:
+            hosts = json.load(infile)
+    except (OSError, ValueError) as error:
+        raise SystemExit(f"ErrorConfig: cant read fleet file {file_name}: {error}") from error
+
+    if not isinstance(hosts, list) or not all(
+            isinstance(x, dict) and x.get("hostname") for x in hosts):
+        raise SystemExit(f"ErrorConfig: fleet file {file_name} needs a list with hostname entries")
+    return [{k: v for k, v in x.items() if k in FLEET_HOST_KEYS} for x in hosts]
+
+
+@dataclass
+class FleetResult:
+    """reports and status of one wallbox"""
+    hostname: str
+    # raw csv export spooled to a temporary file, None if charges were not fetched
+    charge_file: BinaryIO = None
+    charge_count: int = 0
+    rfids: list = field(default_factory=list)
+    stations: list = field(default_factory=list)
+    error: str = None
+    duration: float = 0.0
+
+    def iter_charges(self):
+        """
+        parse the spooled charge export, the charges are not held in memory
+        :return: generator(dict of charge)
+        """
+        if self.charge_file is None:
+            return
+        self.charge_file.seek(0)
+        lines = io.TextIOWrapper(self.charge_file, encoding="utf-8", newline="")
+        try:
+            yield from keba.parse_charges(lines)
+        finally:
+            # keep the spool open, it is closed with close()
+            lines.detach()
+
+    def close(self) -> None:
+        """remove the spooled charge export"""
+        if self.charge_file is not None:
+            self.charge_file.close()
+            self.charge_file = None
+
+
+class KebaFleet:
+    """fetch reports from many wallboxes concurrently, one request at a time per wallbox"""
+
+    def __init__(self, hosts: list, max_workers: int = 4, archive=None) -> None:
+        """
+        init class definition
+        :param hosts: list(dict of KebaWallbox arguments)
+        :param max_workers: wallboxes fetched at the same time
+        :param archive: RawArchive for the raw responses, None to disable
+        """
+        self.hosts = hosts
+        self.max_workers = max_workers
+        self.archive = archive
+        # the wallboxes are slow, allow one login/export per host at a time
+        self.__locks = {x["hostname"]: threading.Lock() for x in hosts}
+
+    def __fetch(self, host: dict, charge_since, rfid: bool, station: bool) -> FleetResult:
+        """
+        login and read the requested reports of one wallbox
+        :param host: KebaWallbox arguments
+        :param charge_since: dict hostname -> datetime, None to skip charges
+        :param rfid: read rfid cards
+        :param station: read wallbox stations
+        """
+        result = FleetResult(hostname=host["hostname"])
+        started = time.monotonic()
+        with self.__locks[result.hostname]:
+            try:
+                wallbox = keba.KebaWallbox(**host)
+                if rfid:
+                    result.rfids = keba.parse_rfids(json.loads(
+                        self.__content(result.hostname, "rfid", wallbox.get_rfid())
+                    ))
+                if charge_since is not None:
+                    self.__spool_charges(result, wallbox, charge_since.get(result.hostname))
+                if station:
+                    result.stations = keba.parse_stations(json.loads(
+                        self.__content(result.hostname, "stations", wallbox.get_station())
+                    ))
+            # a failing wallbox must not stop the others, SystemExit included
+            except (SystemExit, Exception) as error:  # pylint: disable=broad-except
+                result.error = str(error) or error.__class__.__name__
+                result.close()
+        result.duration = time.monotonic() - started
+        return result
+
+    def __content(self, host: str, dataset: str, response) -> bytes:
+        """
+        raw response content, archived if an archive is set
+        :param host: wallbox hostname
+        :param dataset: rfid or stations
+        :param response: requests response
+        :return: bytes
+        """
+        if self.archive:
+            self.archive.store(host, dataset, response.content)
+        return response.content
+
+    def __spool_charges(self, result: FleetResult, wallbox, since) -> None:
+        """
+        stream the charge export to a temporary file, the rows are validated while downloading
+        so a broken export fails this wallbox only
+        :param result: FleetResult, receives the spool and the number of charges
+        :param wallbox: KebaWallbox
+        :param since: export start, None for the default
+        """
+        result.charge_file = tempfile.TemporaryFile("w+b")
+        for _ in wallbox.iter_charges(since, raw_sink=result.charge_file):
+            result.charge_count += 1
+        if self.archive:
+            result.charge_file.seek(0)
+            with self.archive.writer(result.hostname, "charges", since=since) as writer:
+                shutil.copyfileobj(result.charge_file, writer)
+
+    def fetch(self, charge_since: dict = None, rfid: bool = False,
+              station: bool = False) -> list:
+        """
+        read reports from all wallboxes concurrently
+        :param charge_since: dict hostname -> export start (datetime or None), None to skip charges
+        :param rfid: read rfid cards
+        :param station: read wallbox stations
+        :return: list(FleetResult) in order of the fleet file
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self.__fetch, x, charge_since, rfid, station)
+                for x in self.hosts
+            ]
+            return [x.result() for x in futures]
+
+
+def summary(results: list, imported: dict) -> str:
+    """
+    per wallbox success/failure summary
+    :param results: list(FleetResult)
+    :param imported: dict hostname -> (inserted, skipped) charges
+    :return: summary text
+    """
+    lines = [f"Keba Fleet Import {datetime.now():%Y-%m-%d %H:%M:%S}"]
+    for result in results:
+        if result.error:
+            lines.append(f"{result.hostname}: FAILED ({result.duration:.1f}s) {result.error}")
+            continue
+        inserted, skipped = imported.get(result.hostname, (0, 0))
+        lines.append(
+            f"{result.hostname}: OK ({result.duration:.1f}s) "
+            f"charges {inserted} new/{skipped} known, "
+            f"rfid cards {len(result.rfids)}, stations {len(result.stations)}"
+        )
+    return "\n".join(lines)
@@ -1,35 +1,93 @@
 # -*- coding: utf-8 -*-
 """Keba Wallbox Reader"""
 import os
+import re
 import time
 import csv
+import json
+import threading
 from datetime import datetime, timedelta
 from calendar import timegm
 from json import JSONDecodeError
 from http.client import HTTPConnection
-from bs4 import BeautifulSoup
 import requests
 import keba_model
+from metrics import registry, TimedIterator
+from transport import Transport
 
 __version__ = '20240107'
 
 # Debug Request Call 0/1 from `http.client.HTTPConnection`
 HTTPConnection.debuglevel = 0
 
+# <meta content="XXXXX" name="csrf-token"/>, attributes in any order
+CSRF_META = re.compile(r'<meta\s[^>]*name=["\']csrf-token["\'][^>]*>', re.IGNORECASE)
+CSRF_CONTENT = re.compile(r'\scontent=["\']([^"\']*)["\']', re.IGNORECASE)
 
-def gen_unix_date(days: int = 45) -> tuple[str, str]:
+
+def extract_csrf_token(html: str):
+    """
+    read csrf-token from login page without parsing the whole document
+    falls back to BeautifulSoup if the meta tag is not found
+    :param html: login page
+    :return: csrf token or None
+    """
+    csrf_meta = CSRF_META.search(html)
+    if csrf_meta:
+        csrf_content = CSRF_CONTENT.search(csrf_meta.group(0))
+        if csrf_content:
+            return csrf_content.group(1)
+
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    csrf_meta = BeautifulSoup(html, 'lxml').find('meta', attrs={'name': 'csrf-token'})
+    return csrf_meta.get("content") if csrf_meta else None
+
+
+def session_cache_file(cache_dir: str, hostname: str) -> str:
+    """
+    login session cache file of a wallbox
+    :param cache_dir: cache directory
+    :param hostname: wallbox hostname
+    :return: file path
+    """
+    return os.path.join(cache_dir, "session_" + re.sub(r'[^\w.-]', '_', hostname) + ".json")
+
+
+def gen_unix_date(days: int = 45, since: datetime = None,
+                  until: datetime = None) -> tuple[str, str]:
     """
     generate unix timestamp from now and before x days
     :param days: days before now
+    :param since: local datetime to start from, replaces days
+    :param until: local datetime to end at, replaces now
     :return: tuple with two strings (start, end)
     """
     date_start = datetime.utcnow()
     date_end = datetime.utcnow() - timedelta(days)
     utc_time_start = timegm(date_start.utctimetuple()) * 1000
     utc_time_end = timegm(date_end.utctimetuple()) * 1000
+    if since:
+        utc_time_end = int(since.timestamp()) * 1000
+    if until:
+        utc_time_start = int(until.timestamp()) * 1000
     return str(utc_time_start), str(utc_time_end)
 
 
+def gen_windows(since: datetime, until: datetime, window: timedelta) -> list:
+    """
+    split a period into export windows, the last window ends at until
+    :param since: start of the first window
+    :param until: end of the last window
+    :param window: length of a window
+    :return: list of tuples (start, end)
+    """
+    windows = []
+    while since < until:
+        windows.append((since, min(since + window, until)))
+        since += window
+    return windows
+
+
 def csv_to_dict(csv_content: str,
                 field_names: list,
                 csv_delimiter=";",
@@ -70,6 +128,50 @@ def table_header_charges() -> list:
     ]
 
 
+def parse_charges(lines):
+    """
+    validate and translate charge export lines to dictionaries, End is None for open sessions
+    :param lines: iterable of csv lines including the header
+    :return: generator(dict of charge)
+    """
+    lines = iter(lines)
+    # skip csv header
+    next(lines, None)
+    for row in csv.DictReader(lines, fieldnames=table_header_charges(), delimiter=";"):
+        # sessions in progress have an empty End, they are kept with End None
+        yield keba_model.KebaChargeReport(**row).as_dict()
+
+
+def parse_rfids(rfid_cards: list) -> list:
+    """
+    translate /chargingtokens records to custom format
+    :param rfid_cards: list of dict from json response
+    :return: list(dict of rfid cards)
+    """
+    return [vars(keba_model.KebaRFID(**x)) for x in rfid_cards]
+
+
+def parse_stations(stations: list) -> list:
+    """
+    translate /wallboxes records to custom format
+    :param stations: list of dict from json response
+    :return: list(dict of stations)
+    """
+    return [vars(keba_model.KebaStation(**x)) for x in stations]
+
+
+def tee_lines(lines, raw_sink):
+    """
+    pass lines through and write them to a binary sink, e.g. the raw archive
+    :param lines: iterable of str without line endings
+    :param raw_sink: object with write(bytes)
+    :return: generator(str)
+    """
+    for line in lines:
+        raw_sink.write(line.encode() + b"\n")
+        yield line
+
+
 class KebaWallbox:
     """Keba Wallbox WebUI Class"""
 
@@ -78,36 +180,91 @@ class KebaWallbox:
         username=os.environ.get("KEBA_USER", "admin"),
         password=os.environ.get("KEBA_PASS", "admin"),
         hostname=os.environ.get("KEBA_HOST", "192.168.0.1"),
-        proto=os.environ.get("KEBA_PROTO", "http")
+        proto=os.environ.get("KEBA_PROTO", "http"),
+        export_timeout=float(os.environ.get("KEBA_EXPORT_TIMEOUT", 60)),
+        session_cache=os.environ.get(
+            "KEBA_SESSION_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "keba_importer")
+        ),
+        transport: Transport = None
     ) -> None:
         """init class definition"""
+        self.hostname = hostname
+        self.transport = transport or Transport()
+        self.export_timeout = export_timeout
+        self.export_duration = None
         self.__url_base = f"{proto}://{hostname}"
         self.__url_ajax = self.__url_base + "/ajax.php"
         self.__header = {
             "Accept": "*/*",
             "Content-Type": "application/json"
         }
-        self.__session = self.__login__(username, password)
+        self.__credentials = (username, password)
+        self.__cache_file = session_cache_file(session_cache, hostname) if session_cache else None
+        # session and csrf token are replaced together, one re-login for concurrent requests
+        self.__login_lock = threading.Lock()
+        self.__session = self.__load_session() or self.__login__(username, password)
+
+    def __new_session(self):
+        """create pooled http session"""
+        return self.transport.new_session()
+
+    def __load_session(self):
+        """
+        reuse cookies and csrf token of the last login
+        :return: session or None
+        """
+        if not self.__cache_file:
+            return None
+        try:
+            with open(self.__cache_file, 'r', encoding="utf-8") as infile:
+                cache = json.load(infile)
+            self.csrf = cache["csrf"]
+            session = self.__new_session()
+            session.cookies = requests.utils.cookiejar_from_dict(cache["cookies"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return session
+
+    def __save_session(self, session) -> None:
+        """
+        store cookies and csrf token, readable by the owner only
+        :param session: logged in session
+        """
+        if not self.__cache_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.__cache_file), mode=0o700, exist_ok=True)
+            file_handle = os.open(self.__cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(file_handle, 0o600)
+            with os.fdopen(file_handle, 'w', encoding="utf-8") as outfile:
+                json.dump({
+                    "csrf": self.csrf,
+                    "cookies": requests.utils.dict_from_cookiejar(session.cookies)
+                }, outfile)
+        except OSError:
+            # the cache is optional, the next run logs in again
+            pass
 
     def __login__(self, username, password):
         """initialize login session from webui"""
-        session = requests.Session()
-        session.verify = False
-        session.trust_env = True
+        with registry.stage(self.hostname, "login"):
+            return self.__open_session(username, password)
+
+    def __open_session(self, username, password):
+        """login to webui, read csrf token and store the session"""
+        session = self.__new_session()
 
         # read csrf-token from login page
-        # <meta content="XXXXX" name="csrf-token"/>
-        response = session.get(self.__url_base + "/", headers=self.__header)
-        dom_document = BeautifulSoup(response.text, 'lxml')
-        try:
-            csrf_meta = dom_document.find('meta', attrs={'name': 'csrf-token'})
-            csrf_token = csrf_meta.get("content")
-        except AttributeError as error:
-            raise SystemExit("ErrorAPI: cant get csrf token") from error
-
-        # login WebUI
-        response = session.post(
-            self.__url_ajax,
+        response = self.transport.request(
+            session, self.hostname, "GET", self.__url_base + "/", headers=self.__header
+        )
+        csrf_token = extract_csrf_token(response.text)
+        if not csrf_token:
+            raise SystemExit("ErrorAPI: cant get csrf token")
+
+        # login WebUI, a repeated login only opens another session
+        response = self.transport.request(
+            session, self.hostname, "POST", self.__url_ajax,
             headers=self.__header,
             json={
                 "username": username,
@@ -119,8 +276,52 @@ class KebaWallbox:
             raise SystemExit("ErrorAPI: can't open login session")
 
         self.csrf = csrf_token
+        self.__save_session(session)
         return session
 
+    def __send(self, method: str, url: str, payload: dict = None, idempotent: bool = True,
+               **kwargs):
+        """
+        send request with the current csrf token, thread safe
+        an expired session ("Access Denied" or non-OK status) is renewed once by a new login,
+        requests failing with the same session wait for one login, a non-idempotent request
+        is only sent again if the wallbox denied it ("Access Denied", 401/403)
+        :param method: http method
+        :param url: request url
+        :param payload: json payload
+        :param idempotent: False if the request must not be repeated by the transport
+        :return: response
+        """
+        for retry in (True, False):
+            with self.__login_lock:
+                session, csrf = self.__session, self.csrf
+            if payload is not None:
+                payload["csrftoken"] = csrf
+            response = self.transport.request(
+                session, self.hostname, method, url, idempotent=idempotent,
+                headers=self.__header, json=payload, **kwargs
+            )
+            registry.count(self.hostname, "requests")
+            if not kwargs.get("stream"):
+                registry.count(self.hostname, "bytes_downloaded", len(response.content))
+            denied = response.status_code in (401, 403) or (
+                not kwargs.get("stream") and "Access Denied" in response.text
+            )
+            # a 5xx of a non-idempotent request may have reached the wallbox
+            expired = denied or (idempotent and not response.ok)
+            if not expired or not retry:
+                return response
+            response.close()
+            with self.__login_lock:
+                # another thread renewed the session already
+                if self.__session is session:
+                    self.__session = self.__login__(*self.__credentials)
+        return response
+
+    def close(self) -> None:
+        """close http connections, the cached login session stays valid"""
+        self.__session.close()
+
     def __request_model(self, path, method="GET") -> dict:
         """
         define request model
@@ -141,19 +342,50 @@ class KebaWallbox:
         post ajax call
         :param path: requested model path
         """
-        response = self.__session.post(
-            self.__url_ajax,
-            headers=self.__header,
-            json=self.__request_model(path)
-        )
+        response = self.__send("POST", self.__url_ajax, self.__request_model(path))
         if not response.ok:
-            raise TypeError("ErrorAPI: Request response to {path} failed.")
+            raise TypeError(f"ErrorAPI: Request response to {path} failed.")
         return response
 
-    @property
-    def get_charge(self):
-        """get charge sessions"""
-        report_start, report_end = gen_unix_date()
+    def __wait_export(self, delay: float = 0.2, max_delay: float = 2.0) -> dict:
+        """
+        poll the export status with backoff until all sessions are exported
+        the wallbox is not very fast, the overall wait is limited by `export_timeout`
+        :param delay: first poll delay in seconds, doubled on every poll
+        :param max_delay: maximum poll delay in seconds
+        :return: dict of export status
+        """
+        started = time.monotonic()
+        deadline = started + self.export_timeout
+        while True:
+            time.sleep(delay)
+            response = self.__send(
+                "POST", self.__url_ajax, self.__request_model("/chargingsessions/export/status")
+            )
+            try:
+                # {"total":4,"exported":4}
+                export_status = response.json()
+            except JSONDecodeError as error:
+                raise TypeError("ErrorAPI: cant get valid json response") from error
+
+            if export_status.get('exported', 0) >= export_status.get('total', 0):
+                self.export_duration = time.monotonic() - started
+                return export_status
+
+            delay = min(delay * 2, max_delay)
+            if time.monotonic() + delay > deadline:
+                raise SystemExit(
+                    f"ErrorAPI: charge export not finished after {self.export_timeout}s "
+                    f"({export_status.get('exported')}/{export_status.get('total')})."
+                )
+
+    def get_charge(self, since: datetime = None, until: datetime = None):
+        """
+        get charge sessions
+        :param since: export charges from this datetime, default last 45 days
+        :param until: export charges until this datetime, default now
+        """
+        report_start, report_end = gen_unix_date(since=since, until=until)
         data = {
             "csrftoken": self.csrf,
             "exportchargingsessions": {
@@ -166,39 +398,21 @@ class KebaWallbox:
                 ], "order": [{"column": 5, "dir": "desc"}]
             }
         }
-        response = self.__session.post(
-            self.__url_ajax,
-            headers=self.__header,
-            json=data
-        )
+        with registry.stage(self.hostname, "export_request"):
+            # starting an export twice would restart the running one
+            response = self.__send("POST", self.__url_ajax, data, idempotent=False)
         if not response.ok:
             raise SystemExit("ErrorAPI: cant execute report request.")
 
-        # slow down. the wallbox is not very fast,...
-        time.sleep(1)
-
-        # get export status
-        response = self.__session.post(
-            self.__url_ajax,
-            headers=self.__header,
-            json=self.__request_model("/chargingsessions/export/status")
-        )
-        try:
-            # {"total":4,"exported":4}
-            export_status = response.json()
-        except JSONDecodeError as error:
-            raise TypeError("ErrorAPI: cant get valid json response") from error
-
-        if not export_status.get('exported') or export_status['exported'] == 0:
+        with registry.stage(self.hostname, "export_wait"):
+            export_status = self.__wait_export()
+        if not export_status.get('exported'):
             # we found no exported reports
             return None
 
-        # slow down. the wallbox is not very fast,...
-        time.sleep(1)
-
-        response = self.__session.get(
-            self.__url_base + f"/export.php?chargingsessions=&t={report_start}",
-            headers=self.__header
+        response = self.__send(
+            "GET", self.__url_base + f"/export.php?chargingsessions=&t={report_start}",
+            stream=True
         )
         if not response.ok:
             raise SystemExit("ErrorAPI: cant initiate csv export.")
@@ -213,41 +427,64 @@ class KebaWallbox:
 
     def get_rfid(self):
         """get rfid tokens"""
-        response = self.__session.post(
-            self.__url_ajax,
-            headers=self.__header,
-            json=self.__request_model("/chargingtokens")
-        )
+        response = self.__send("POST", self.__url_ajax, self.__request_model("/chargingtokens"))
         if not response.ok:
             raise SystemExit("ErrorAPI: cant get rfid tokens.")
         return response
 
     def get_station(self):
         """get wallbox stations"""
-        response = self.__session.post(
-            self.__url_ajax,
-            headers=self.__header,
-            json=self.__request_model("/wallboxes")
-        )
+        response = self.__send("POST", self.__url_ajax, self.__request_model("/wallboxes"))
         if not response.ok:
             raise SystemExit("ErrorAPI: cant get wallbox stations.")
 
         return response
 
-    def read_charges(self) -> list:
+    def iter_charges(self, since: datetime = None, until: datetime = None,
+                     chunk_size: int = 65536, raw_sink=None):
+        """
+        stream charges from the csv export, validate and translate to dictionary
+        the export is parsed line by line while it is downloaded
+        :param since: export charges from this datetime, default last 45 days
+        :param until: export charges until this datetime, default now
+        :param chunk_size: download chunk size in bytes
+        :param raw_sink: object with write(bytes), receives the csv lines, e.g. ArchiveWriter
+        :return: generator(dict of charge)
+        """
+        charge_imported = self.get_charge(since, until)
+        if charge_imported is None:
+            return
+
+        with charge_imported:
+            charge_imported.encoding = charge_imported.encoding or "utf-8"
+            # download and parse time are told apart, the time of the consumer is excluded
+            lines = TimedIterator(
+                charge_imported.iter_lines(chunk_size=chunk_size, decode_unicode=True)
+            )
+            charges = 0
+            work = 0.0
+            started = time.perf_counter()
+            try:
+                for charge in parse_charges(tee_lines(lines, raw_sink) if raw_sink else lines):
+                    charges += 1
+                    work += time.perf_counter() - started
+                    yield charge
+                    started = time.perf_counter()
+                work += time.perf_counter() - started
+            finally:
+                registry.add_time(self.hostname, "download", lines.seconds)
+                registry.add_time(self.hostname, "parse", max(0.0, work - lines.seconds))
+                registry.count(self.hostname, "charges_fetched", charges)
+                if hasattr(charge_imported.raw, "tell"):
+                    registry.count(self.hostname, "bytes_downloaded", charge_imported.raw.tell())
+
+    def read_charges(self, since: datetime = None) -> list:
         """
         read charges, validate and translate to dictionary
+        :param since: export charges from this datetime, default last 45 days
         :return: list(dict of charges)
         """
-        charge_imported = self.get_charge
-        report_content = charge_imported.text
-        report_dict = csv_to_dict(
-            report_content, table_header_charges(), ";", True
-        )
-
-        # Workaround for empty End for Status != CLOSED
-        report_dict = [z for z in report_dict if z['End'] != '']
-        return [vars(keba_model.KebaChargeReport(**x)) for x in report_dict]
+        return list(self.iter_charges(since))
 
     def read_rfids(self) -> list:
         """
@@ -255,8 +492,7 @@ class KebaWallbox:
         :return: list(dict of charges)
         """
         rfid_imported = self.get_rfid()
-        rfid_cards = rfid_imported.json()
-        return [vars(keba_model.KebaRFID(**x)) for x in rfid_cards]
+        return parse_rfids(rfid_imported.json())
 
     def read_stations(self) -> list:
         """
@@ -264,5 +500,4 @@ class KebaWallbox:
         :return: list(dict of charges)
         """
         station_imported = self.get_station()
-        stations = station_imported.json()
-        return [vars(keba_model.KebaStation(**x)) for x in stations]
+        return parse_stations(station_imported.json())
@@ -18,6 +18,32 @@ def unix_to_datetime(unix_timestamp: int) -> str:
     ).strftime('%Y-%m-%d %H:%M:%S')
 
 
+def parse_keba_datetime(date_string: str) -> datetime:
+    """
+    parse fixed layout timestamp from csv export by slicing, without strptime
+    13-07-2022 18:24:06 -> datetime(2022, 7, 13, 18, 24, 6)
+    :param date_string: timestamp '%d-%m-%Y %H:%M:%S'
+    """
+    if len(date_string) != 19:
+        return datetime.strptime(date_string, '%d-%m-%Y %H:%M:%S')
+    return datetime(
+        int(date_string[6:10]), int(date_string[3:5]), int(date_string[0:2]),
+        int(date_string[11:13]), int(date_string[14:16]), int(date_string[17:19])
+    )
+
+
+def meter_int(value) -> int:
+    """
+    live meter value as integer, missing or invalid values are 0
+    1234.6 -> 1235, None -> 0
+    :param value: number or numeric string from json
+    """
+    try:
+        return round(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
 def repr_without_none(cls):
     """dataclass decorator for representer without none values"""
     original_repr = cls.__repr__
@@ -37,28 +63,42 @@ def repr_without_none(cls):
 @dataclass
 class KebaChargeReport:
     """custom charge report from csv"""
+    __slots__ = (
+        'StationID', 'Serial', 'RFID', 'Status', 'Start', 'End',
+        'Duration', 'MeterStart', 'MeterEnd', 'Consumption'
+    )
     StationID: int
     Serial: str
     RFID: str
     Status: str
-    Start: str
-    End: str
-    Duration: int
+    Start: datetime
+    End: Optional[datetime]
+    Duration: Optional[int]
     MeterStart: int
-    MeterEnd: int
-    Consumption: float
+    MeterEnd: Optional[int]
+    Consumption: Optional[float]
 
     def __post_init__(self):
         """translation and verification"""
-        date_format = '%d-%m-%Y %H:%M:%S'
-        self.End = str(datetime.strptime(str(self.End), date_format))
-        self.Start = str(datetime.strptime(str(self.Start), date_format))
-        self.Duration = int(self.Duration)
+        self.Start = parse_keba_datetime(self.Start)
         self.StationID = int(self.StationID)
-        self.Consumption = float(self.Consumption)
         self.MeterStart = round(float(self.MeterStart))
+        if not self.End:
+            # session in progress, End and the closing values may be empty
+            self.End = None
+            self.Duration = int(self.Duration) if self.Duration else None
+            self.Consumption = float(self.Consumption) if self.Consumption else None
+            self.MeterEnd = round(float(self.MeterEnd)) if self.MeterEnd else None
+            return
+        self.End = parse_keba_datetime(self.End)
+        self.Duration = int(self.Duration)
+        self.Consumption = float(self.Consumption)
         self.MeterEnd = round(float(self.MeterEnd))
 
+    def as_dict(self) -> dict:
+        """column dictionary for database import"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
 
 # @repr_without_none
 @dataclass
@@ -90,6 +130,12 @@ class MeterLines:
     current: int
     voltage: int
 
+    def __init__(self, **kwargs):
+        """filter unused key, value pairs, missing values are None"""
+        names = [f.name for f in fields(self)]
+        self.__dict__.update(dict.fromkeys(names))
+        self.__dict__.update({k: v for k, v in kwargs.items() if k in names})
+
 
 @dataclass
 class StationMeter:
@@ -102,6 +148,30 @@ class StationMeter:
     temperature: int
     lines: List[MeterLines]
 
+    def __init__(self, **kwargs):
+        """filter unused key, value pairs, missing values are None, translate nested lines"""
+        names = [f.name for f in fields(self)]
+        self.__dict__.update(dict.fromkeys(names))
+        self.__dict__.update({k: v for k, v in kwargs.items() if k in names})
+        self.lines = [
+            x if isinstance(x, MeterLines) else MeterLines(**x) for x in self.lines or []
+        ]
+
+    def sample(self) -> tuple:
+        """
+        flat live values in order of telemetry.SAMPLE_FIELDS as integers,
+        missing phases and missing or invalid values are 0
+        :return: tuple (meterValue, totalActivePower, current L1-L3, voltage L1-L3, temperature)
+        """
+        phases = {x.socketPhase: x for x in self.lines}
+        lines = [phases.get(x) for x in ("L1", "L2", "L3")]
+        return (
+            meter_int(self.meterValue), meter_int(self.totalActivePower),
+            *(meter_int(x.current) if x else 0 for x in lines),
+            *(meter_int(x.voltage) if x else 0 for x in lines),
+            meter_int(self.temperature)
+        )
+
 
 @dataclass
 class KebaStation:
@@ -122,7 +192,8 @@ class KebaStation:
     # mvaPublicKey: str
     # vehiclePlugged: bool
     # dipSwitchSettings: list[bool]
-    # meter: dict[StationMeter]
+    # live values, see StationMeter, not stored in stations
+    meter: dict
 
     def __init__(self, **kwargs):
         """filter unused key, value pairs"""
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Import Metrics for KEBA Reporter
+stage timings and counters per wallbox, written as structured log and prometheus textfile
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger("keba.metrics")
+
+# upper bounds in seconds of the latency histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class TimedIterator:
+    """iterator measuring only the time spent in its steps, not the work of the consumer"""
+
+    def __init__(self, iterable) -> None:
+        """
+        init class definition
+        :param iterable: iterable or generator
+        """
+        self.iterator = iter(iterable)
+        self.seconds = 0.0
+        self.items = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            item = next(self.iterator)
+        finally:
+            self.seconds += time.perf_counter() - started
+        self.items += 1
+        return item
+
+
+class ImportMetrics:
+    """stage timings and counters per host, thread safe for fleet imports"""
+
+    def __init__(self) -> None:
+        """init class definition"""
+        self.lock = threading.Lock()
+        self.seconds = defaultdict(float)
+        self.runs = defaultdict(int)
+        self.counters = defaultdict(int)
+        # (host, name) -> [count per bucket..., count above, sum, max]
+        self.latencies = {}
+
+    def add_time(self, host: str, stage: str, seconds: float) -> None:
+        """
+        add the duration of a stage
+        :param host: wallbox hostname
+        :param stage: stage name, e.g. login, export_wait, download, parse, charge_store
+        :param seconds: duration
+        """
+        with self.lock:
+            self.seconds[(host, stage)] += seconds
+            self.runs[(host, stage)] += 1
+        logger.debug(json.dumps({"event": "stage", "host": host, "stage": stage,
+                                 "seconds": round(seconds, 4)}))
+
+    def count(self, host: str, name: str, value: int = 1) -> None:
+        """
+        increase a counter
+        :param host: wallbox hostname
+        :param name: counter name, e.g. charges_inserted, bytes_downloaded
+        :param value: increment
+        """
+        with self.lock:
+            self.counters[(host, name)] += value
+
+    def observe(self, host: str, name: str, seconds: float) -> None:
+        """
+        add a latency to a histogram
+        :param host: wallbox hostname
+        :param name: histogram name, e.g. http_request
+        :param seconds: latency
+        """
+        with self.lock:
+            values = self.latencies.get((host, name))
+            if values is None:
+                values = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0.0]
+                self.latencies[(host, name)] = values
+            index = next(
+                (i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound),
+                len(LATENCY_BUCKETS)
+            )
+            values[index] += 1
+            values[-2] += seconds
+            values[-1] = max(values[-1], seconds)
+
+    @contextmanager
+    def stage(self, host: str, stage: str):
+        """
+        time a block as stage
+        :param host: wallbox hostname
+        :param stage: stage name
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(host, stage, time.perf_counter() - started)
+
+    def hosts(self) -> dict:
+        """
+        metrics per host
+        :return: dict host -> {"stages": {stage: seconds}, "counters": {name: value},
+                 "latency": {name: {"count": n, "sum": seconds, "max": seconds}}}
+        """
+        with self.lock:
+            result = defaultdict(lambda: {"stages": {}, "counters": {}, "latency": {}})
+            for (host, stage), seconds in self.seconds.items():
+                result[host]["stages"][stage] = round(seconds, 4)
+            for (host, name), value in self.counters.items():
+                result[host]["counters"][name] = value
+            for (host, name), values in self.latencies.items():
+                result[host]["latency"][name] = {
+                    "count": sum(values[:-2]), "sum": round(values[-2], 4),
+                    "max": round(values[-1], 4)
+                }
+        return dict(result)
+
+    def log_summary(self) -> None:
+        """log one json line per host with all stage timings and counters"""
+        for host, values in self.hosts().items():
+            logger.info(json.dumps({"event": "import", "host": host, **values}))
+
+    def prometheus(self) -> str:
+        """
+        metrics in prometheus text exposition format
+        :return: text
+        """
+        lines = [
+            "# HELP keba_import_stage_seconds_total Time spent in import stages.",
+            "# TYPE keba_import_stage_seconds_total counter",
+        ]
+        with self.lock:
+            seconds = sorted(self.seconds.items())
+            runs = sorted(self.runs.items())
+            counters = sorted(self.counters.items())
+            latencies = sorted((key, list(values)) for key, values in self.latencies.items())
+        lines += [
+            f'keba_import_stage_seconds_total{{host="{host}",stage="{stage}"}} {value:.6f}'
+            for (host, stage), value in seconds
+        ]
+        lines += [
+            "# HELP keba_import_stage_runs_total Number of timed import stages.",
+            "# TYPE keba_import_stage_runs_total counter",
+        ]
+        lines += [
+            f'keba_import_stage_runs_total{{host="{host}",stage="{stage}"}} {value}'
+            for (host, stage), value in runs
+        ]
+        for name in sorted({name for (_, name) in self.counters}):
+            lines += [
+                f"# HELP keba_import_{name}_total Imported {name.replace('_', ' ')}.",
+                f"# TYPE keba_import_{name}_total counter",
+            ]
+            lines += [
+                f'keba_import_{name}_total{{host="{host}"}} {value}'
+                for (host, counter), value in counters if counter == name
+            ]
+        for name in sorted({name for (_, name), _ in latencies}):
+            lines += [
+                f"# HELP keba_import_{name}_seconds Latency of {name.replace('_', ' ')}s.",
+                f"# TYPE keba_import_{name}_seconds histogram",
+            ]
+            for (host, histogram), values in latencies:
+                if histogram != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), values[:-2]):
+                    cumulative += count
+                    lines.append(
+                        f'keba_import_{name}_seconds_bucket{{host="{host}",le="{bound}"}} '
+                        f'{cumulative}'
+                    )
+                lines.append(f'keba_import_{name}_seconds_sum{{host="{host}"}} {values[-2]:.6f}')
+                lines.append(f'keba_import_{name}_seconds_count{{host="{host}"}} {cumulative}')
+        lines += [
+            "# HELP keba_import_last_run_timestamp_seconds Time of the last metrics update.",
+            "# TYPE keba_import_last_run_timestamp_seconds gauge",
+            f"keba_import_last_run_timestamp_seconds {time.time():.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_name: str) -> None:
+        """
+        write metrics for the node_exporter textfile collector, replaced atomically
+        :param file_name: target file, should end with .prom
+        """
+        with open(file_name + ".tmp", 'w', encoding="utf-8") as outfile:
+            outfile.write(self.prometheus())
+        os.replace(file_name + ".tmp", file_name)
+
+
+# metrics of this process
+registry = ImportMetrics()
+
+
+def start_profile(file_name: str) -> None:
+    """
+    profile the whole process with cProfile, the stats are written on exit
+    read with: python -m pstats <file_name>
+    :param file_name: pstats output file
+    """
+    import cProfile  # pylint: disable=import-outside-toplevel
+
+    profiler = cProfile.Profile()
+
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(file_name)
+
+    atexit.register(dump)
+    profiler.enable()
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only Parquet Store for KEBA Reporter
+charges are partitioned by month of Start: <path>/charges/month=2024-01/<uuid>.parquet
+"""
+import os
+import json
+import uuid
+from datetime import date, datetime
+from collections import defaultdict
+import crud
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError as import_error:
+    raise SystemExit(
+        "ErrorConfig: parquet storage needs pyarrow, install with: pip install pyarrow"
+    ) from import_error
+
+
+CHARGE_SCHEMA = pa.schema([
+    ("StationID", pa.int32()),
+    ("Serial", pa.string()),
+    ("RFID", pa.string()),
+    ("Status", pa.string()),
+    ("Start", pa.timestamp("s")),
+    ("End", pa.timestamp("s")),
+    ("Duration", pa.int32()),
+    ("MeterStart", pa.int64()),
+    ("MeterEnd", pa.int64()),
+    ("Consumption", pa.float64()),
+])
+
+METER_SCHEMA = pa.schema(
+    [("Serial", pa.string()), ("Time", pa.timestamp("s")), ("Samples", pa.int32())]
+    + [(x, pa.int64()) for x in (
+        "MeterValue", "Power", "PowerMax", "CurrentL1", "CurrentL2", "CurrentL3",
+        "VoltageL1", "VoltageL2", "VoltageL3", "Temperature"
+    )]
+)
+
+
+def write_parquet(table, file_name: str) -> None:
+    """
+    write parquet file atomically, readers never see partial files
+    :param table: pyarrow table
+    :param file_name: target file
+    """
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    pq.write_table(table, file_name + ".tmp", compression="zstd")
+    os.replace(file_name + ".tmp", file_name)
+
+
+class KebaParquetStore:
+    """Keba parquet storage, same import interface as crud.KebaDB"""
+    dialect = "parquet"
+
+    def __init__(self, path: str) -> None:
+        """
+        init class definition
+        :param path: store directory
+        """
+        self.path = path
+        self.__charges = os.path.join(path, "charges")
+        self.__state = os.path.join(path, "import_state.json")
+        self.__digests = os.path.join(path, "import_digests.json")
+        self.__backfill = os.path.join(path, "backfill_windows.json")
+        self.__meter = os.path.join(path, "meter_samples")
+
+    def setup(self) -> None:
+        """create store directory"""
+        os.makedirs(self.__charges, exist_ok=True)
+
+    def rollback(self) -> None:
+        """nothing to reset, files are written atomically"""
+
+    def close(self) -> None:
+        """nothing to close"""
+
+    def __month_dir(self, month: str) -> str:
+        """partition directory of a month (YYYY-MM)"""
+        return os.path.join(self.__charges, f"month={month}")
+
+    def __known_keys(self, month: str) -> set:
+        """
+        keys (Serial, Start, RFID) of a month partition, only the key columns are read
+        :param month: YYYY-MM
+        :return: set of tuples
+        """
+        month_dir = self.__month_dir(month)
+        if not os.path.isdir(month_dir):
+            return set()
+        table = ds.dataset(month_dir, format="parquet", schema=CHARGE_SCHEMA).to_table(
+            columns=["Serial", "Start", "RFID"]
+        )
+        return set(zip(*(table.column(x).to_pylist() for x in ("Serial", "Start", "RFID"))))
+
+    def __read_state(self) -> dict:
+        """import state name -> watermark iso string"""
+        try:
+            with open(self.__state, 'r', encoding="utf-8") as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return {}
+
+    def get_watermark(self, name: str):
+        """
+        get the latest imported charge end of a wallbox
+        :param name: state name (wallbox hostname)
+        :return: datetime or None
+        """
+        watermark = self.__read_state().get(name)
+        return datetime.fromisoformat(watermark) if watermark else None
+
+    def set_watermark(self, name: str, watermark) -> None:
+        """
+        move the import watermark of a wallbox forward, never backwards
+        :param name: state name (wallbox hostname)
+        :param watermark: datetime or string of the latest charge end
+        """
+        if isinstance(watermark, str):
+            watermark = datetime.fromisoformat(watermark)
+        state = self.__read_state()
+        if state.get(name) and datetime.fromisoformat(state[name]) >= watermark:
+            return
+        state[name] = watermark.isoformat(sep=" ")
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.__state + ".tmp", 'w', encoding="utf-8") as outfile:
+            json.dump(state, outfile)
+        os.replace(self.__state + ".tmp", self.__state)
+
+    def get_open_since(self, name: str):
+        """
+        get the start of the oldest charge session in progress of a wallbox
+        :param name: state name (wallbox hostname)
+        :return: datetime or None
+        """
+        open_since = self.__read_state().get(f"{name}/open_since")
+        return datetime.fromisoformat(open_since) if open_since else None
+
+    def __set_open_since(self, name: str, open_since, first_start) -> None:
+        """
+        store the start of the oldest session in progress of an import,
+        a stored start before the export is kept, e.g. for backfill windows
+        :param name: state name (wallbox hostname)
+        :param open_since: oldest Start of the sessions in progress or None
+        :param first_start: oldest Start of the export
+        """
+        state = self.__read_state()
+        stored = state.get(f"{name}/open_since")
+        if stored and datetime.fromisoformat(stored) < first_start:
+            open_since = min(datetime.fromisoformat(stored), open_since or first_start)
+        state[f"{name}/open_since"] = open_since.isoformat(sep=" ") if open_since else None
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.__state + ".tmp", 'w', encoding="utf-8") as outfile:
+            json.dump(state, outfile)
+        os.replace(self.__state + ".tmp", self.__state)
+
+    def get_digest(self, name: str):
+        """
+        get the hash of the last imported payload
+        :param name: state name, e.g. <hostname>/rfid
+        :return: sha256 hex digest or None
+        """
+        try:
+            with open(self.__digests, 'r', encoding="utf-8") as infile:
+                return json.load(infile).get(name)
+        except (OSError, ValueError):
+            return None
+
+    def set_digest(self, name: str, digest: str) -> None:
+        """
+        store the hash of an imported payload
+        :param name: state name, e.g. <hostname>/rfid
+        :param digest: sha256 hex digest
+        """
+        try:
+            with open(self.__digests, 'r', encoding="utf-8") as infile:
+                digests = json.load(infile)
+        except (OSError, ValueError):
+            digests = {}
+        digests[name] = digest
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.__digests + ".tmp", 'w', encoding="utf-8") as outfile:
+            json.dump(digests, outfile)
+        os.replace(self.__digests + ".tmp", self.__digests)
+
+    def get_backfill_windows(self, host: str) -> list:
+        """
+        completed backfill windows of a wallbox
+        :param host: wallbox hostname
+        :return: list of tuples (since, until)
+        """
+        try:
+            with open(self.__backfill, 'r', encoding="utf-8") as infile:
+                windows = json.load(infile).get(host, [])
+        except (OSError, ValueError):
+            return []
+        return [(datetime.fromisoformat(x["since"]), datetime.fromisoformat(x["until"]))
+                for x in windows]
+
+    def complete_backfill_window(self, host: str, since: datetime, until: datetime,
+                                 inserted: int, skipped: int) -> None:
+        """
+        checkpoint an imported backfill window
+        :param host: wallbox hostname
+        :param since: window start
+        :param until: window end
+        :param inserted: new charges
+        :param skipped: known charges
+        """
+        try:
+            with open(self.__backfill, 'r', encoding="utf-8") as infile:
+                state = json.load(infile)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault(host, []).append({
+            "since": since.isoformat(sep=" "), "until": until.isoformat(sep=" "),
+            "inserted": inserted, "skipped": skipped,
+            "completed": datetime.now().isoformat(sep=" ", timespec="seconds")
+        })
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.__backfill + ".tmp", 'w', encoding="utf-8") as outfile:
+            json.dump(state, outfile)
+        os.replace(self.__backfill + ".tmp", self.__backfill)
+
+    def insert_charges(self, charges, batch_size: int = 50000,
+                       state_key: str = None) -> tuple[int, int]:
+        """
+        append new charges, one file per month partition and import
+        known sessions (Serial, Start, RFID) are skipped, sessions in progress (End None)
+        are skipped until they are exported closed, files are not updated
+        :param charges: iterable of dictionaries with charges
+        :param batch_size: buffered rows per partition before a file is written
+        :param state_key: update the import watermark and open_since of this wallbox
+        :return: tuple (inserted, skipped)
+        """
+        columns = crud.TableImport.__table__.columns
+        known = {}
+        pending = defaultdict(list)
+        inserted = skipped = 0
+        watermark = open_since = first_start = None
+        for charge in charges:
+            row = {k: crud.column_value(columns[k], charge.get(k)) for k in CHARGE_SCHEMA.names}
+            if first_start is None or row["Start"] < first_start:
+                first_start = row["Start"]
+            if row["End"] is None:
+                skipped += 1
+                open_since = min(open_since, row["Start"]) if open_since else row["Start"]
+                continue
+            month = row["Start"].strftime("%Y-%m")
+            if month not in known:
+                known[month] = self.__known_keys(month)
+            key = (row["Serial"], row["Start"], row["RFID"])
+            if key in known[month]:
+                skipped += 1
+                continue
+            known[month].add(key)
+            pending[month].append(row)
+            inserted += 1
+            watermark = max(watermark, row["End"]) if watermark else row["End"]
+            if len(pending[month]) >= batch_size:
+                self.__write_charges(month, pending.pop(month))
+
+        for month, rows in pending.items():
+            self.__write_charges(month, rows)
+        if state_key and watermark:
+            self.set_watermark(state_key, watermark)
+        if state_key and first_start:
+            self.__set_open_since(state_key, open_since, first_start)
+        return inserted, skipped
+
+    def __write_charges(self, month: str, rows: list) -> None:
+        """append rows as new file to a month partition"""
+        write_parquet(
+            pa.Table.from_pylist(rows, schema=CHARGE_SCHEMA),
+            os.path.join(self.__month_dir(month), f"{uuid.uuid4().hex}.parquet")
+        )
+
+    def insert_meter_samples(self, samples) -> int:
+        """
+        append downsampled meter values, one file per month partition and flush
+        :param samples: iterable of dictionaries, see telemetry.downsample
+        :return: inserted rows
+        """
+        months = defaultdict(list)
+        for sample in samples:
+            months[sample["Time"].strftime("%Y-%m")].append(sample)
+        for month, rows in months.items():
+            write_parquet(
+                pa.Table.from_pylist(rows, schema=METER_SCHEMA),
+                os.path.join(self.__meter, f"month={month}", f"{uuid.uuid4().hex}.parquet")
+            )
+        return sum(len(x) for x in months.values())
+
+    def sync(self, table, key: str, rows, delete_missing: bool = False) -> dict:
+        """
+        sync a small table file with imported rows, the file is rewritten on changes
+        :param table: ORM model of the same table in crud
+        :param key: primary key attribute
+        :param rows: iterable of dictionaries
+        :param delete_missing: delete entries missing in rows
+        :return: dict of inserted keys, updated keys with changed fields, deleted keys,
+            unchanged count
+        """
+        columns = table.__table__.columns
+        file_name = os.path.join(self.path, f"{table.__tablename__}.parquet")
+        existing = {}
+        if os.path.exists(file_name):
+            # files of older versions may hold other types, e.g. '1' for booleans
+            existing = {
+                x[key]: {k: crud.column_value(columns[k], v) for k, v in x.items()}
+                for x in pq.read_table(file_name).to_pylist()
+            }
+
+        changes = {"inserted": [], "updated": {}, "deleted": [], "unchanged": 0}
+        entries = {} if delete_missing else dict(existing)
+        for row in rows:
+            values = {k: crud.column_value(columns[k], v) for k, v in row.items() if k in columns}
+            entry = existing.get(values[key])
+            entries[values[key]] = values
+            if entry is None:
+                changes["inserted"].append(values[key])
+                continue
+            changed = sorted(k for k, v in values.items() if entry.get(k) != v)
+            if changed:
+                changes["updated"][values[key]] = changed
+            else:
+                changes["unchanged"] += 1
+
+        if delete_missing:
+            changes["deleted"] = [k for k in existing if k not in entries]
+        if changes["inserted"] or changes["updated"] or changes["deleted"]:
+            write_parquet(pa.Table.from_pylist(list(entries.values())), file_name)
+        return changes
+
+    def sync_rfid_cards(self, rfid_cards, delete_missing: bool = False) -> dict:
+        """
+        sync rfid cards
+        :param rfid_cards: iterable of dictionaries with rfid cards
+        :param delete_missing: delete cards missing on the wallbox
+        :return: dict of changes, see sync
+        """
+        return self.sync(crud.TableRfidCards, "id", rfid_cards, delete_missing)
+
+    def sync_stations(self, stations, delete_missing: bool = False) -> dict:
+        """
+        sync wallbox stations
+        :param stations: iterable of dictionaries with wallbox stations
+        :param delete_missing: delete stations missing on the wallbox
+        :return: dict of changes, see sync
+        """
+        return self.sync(crud.TableStations, "serialNumber", stations, delete_missing)
+
+    def consumption_by_rfid(self, since: datetime = None, until: datetime = None) -> dict:
+        """
+        consumption and number of charge sessions per rfid card
+        month partitions outside of the period are not read
+        :param since: charges starting at or after
+        :param until: charges starting before
+        :return: dict rfid -> (consumption, sessions)
+        """
+        if not os.path.isdir(self.__charges):
+            return {}
+        dataset = ds.dataset(self.__charges, format="parquet", partitioning="hive")
+        condition = None
+        if since:
+            condition = (ds.field("month") >= since.strftime("%Y-%m")) & (
+                ds.field("Start") >= pa.scalar(since, pa.timestamp("s"))
+            )
+        if until:
+            until_condition = (ds.field("month") <= until.strftime("%Y-%m")) & (
+                ds.field("Start") < pa.scalar(until, pa.timestamp("s"))
+            )
+            condition = until_condition if condition is None else condition & until_condition
+        table = dataset.to_table(columns=["RFID", "Consumption"], filter=condition)
+        result = table.group_by("RFID").aggregate([("Consumption", "sum"), ("RFID", "count")])
+        return {
+            rfid: (consumption, sessions) for rfid, consumption, sessions in zip(
+                result.column("RFID").to_pylist(),
+                pc.round(result.column("Consumption_sum"), 2).to_pylist(),
+                result.column("RFID_count").to_pylist()
+            )
+        }
+
+    def rebuild_rollups(self) -> None:
+        """nothing to rebuild, reports aggregate the month partitions directly"""
+
+    def maintain_partitions(self, ahead: int = 3, keep_months: int = 0,
+                            archive_dir: str = None) -> dict:
+        """
+        month partitions are created on write, the reports read charges directly
+        and would lose dropped months
+        """
+        raise SystemExit("ErrorConfig: charge partitions need MySQL/MariaDB")
+
+    def consumption_report(self, since: date, until: date, rfid: str = None) -> dict:
+        """
+        consumption per rfid card and station, only the month partitions of the period are read
+        :param since: first day
+        :param until: day after the period
+        :param rfid: only this rfid card
+        :return: dict (rfid, station id) -> (consumption, sessions)
+        """
+        if not os.path.isdir(self.__charges):
+            return {}
+        since = datetime.combine(since, datetime.min.time())
+        until = datetime.combine(until, datetime.min.time())
+        condition = (
+            (ds.field("month") >= since.strftime("%Y-%m"))
+            & (ds.field("month") <= until.strftime("%Y-%m"))
+            & (ds.field("Start") >= pa.scalar(since, pa.timestamp("s")))
+            & (ds.field("Start") < pa.scalar(until, pa.timestamp("s")))
+        )
+        if rfid is not None:
+            condition = condition & (ds.field("RFID") == rfid)
+        dataset = ds.dataset(self.__charges, format="parquet", partitioning="hive")
+        table = dataset.to_table(columns=["RFID", "StationID", "Consumption"], filter=condition)
+        result = table.group_by(["RFID", "StationID"]).aggregate(
+            [("Consumption", "sum"), ("RFID", "count")]
+        )
+        return {
+            (card, station_id): (consumption, sessions)
+            for card, station_id, consumption, sessions in zip(
+                result.column("RFID").to_pylist(),
+                result.column("StationID").to_pylist(),
+                pc.round(result.column("Consumption_sum"), 2).to_pylist(),
+                result.column("RFID_count").to_pylist()
+            )
+        }
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Pipelined Import for KEBA Reporter
+wallbox fetches run in threads and hand over batches through bounded queues,
+the database is only written by the consuming thread
+"""
+import json
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger("keba.pipeline")
+
+# end of a feed
+_DONE = object()
+
+
+class BatchFeed:
+    """bounded queue of batches from a producer thread to the consumer, errors reach the consumer"""
+
+    def __init__(self, batch_size: int = 500, max_batches: int = 4) -> None:
+        """
+        init class definition
+        :param batch_size: items per batch
+        :param max_batches: queued batches, the producer waits if the consumer falls behind
+        """
+        self.batch_size = batch_size
+        self.queue = queue.Queue(max_batches)
+        self.cancelled = threading.Event()
+        # producer waited for the consumer, e.g. database writes
+        self.put_wait = 0.0
+        # consumer waited for the producer, e.g. wallbox export and download
+        self.get_wait = 0.0
+
+    def produce(self, iterable) -> None:
+        """
+        read the iterable into the queue, run in the producer thread
+        stops early if the consumer is gone
+        :param iterable: iterable or generator, closed at the end
+        """
+        batch = []
+        try:
+            for item in iterable:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    if not self.__put(batch):
+                        return
+                    batch = []
+            if batch and not self.__put(batch):
+                return
+            self.__put(_DONE)
+        except BaseException as error:  # pylint: disable=broad-exception-caught
+            self.__put(error)
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    def __put(self, item) -> bool:
+        """
+        queue an item, wait while the queue is full
+        :param item: batch, _DONE or exception
+        :return: False if the consumer is gone
+        """
+        started = time.perf_counter()
+        try:
+            while not self.cancelled.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.put_wait += time.perf_counter() - started
+
+    def __iter__(self):
+        """
+        items in order of the producer, raises the error of the producer
+        :return: generator
+        """
+        try:
+            while True:
+                started = time.perf_counter()
+                item = self.queue.get()
+                self.get_wait += time.perf_counter() - started
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield from item
+        finally:
+            self.cancelled.set()
+
+
+class RunTimer:
+    """wall time of a pipelined run compared to the time spent in its stages"""
+
+    def __init__(self, registry, host: str) -> None:
+        """
+        init class definition
+        :param registry: ImportMetrics
+        :param host: wallbox hostname
+        """
+        self.registry = registry
+        self.host = host
+        self.busy = self.__stage_seconds()
+        self.started = time.perf_counter()
+
+    def __stage_seconds(self) -> float:
+        """sum of all stage timings of the host"""
+        stages = self.registry.hosts().get(self.host, {}).get("stages", {})
+        return sum(
+            seconds for stage, seconds in stages.items() if not stage.startswith("pipeline")
+        )
+
+    def stop(self, feed: BatchFeed = None) -> dict:
+        """
+        record the run as stages pipeline (wall time) and pipeline_overlap (concurrent time)
+        busy is the time of all stages of the run, overlap the part of it that ran concurrently
+        :param feed: BatchFeed of the charges, adds the waits of both sides to the log
+        :return: dict with seconds, busy and overlap
+        """
+        seconds = time.perf_counter() - self.started
+        busy = self.__stage_seconds() - self.busy
+        overlap = max(0.0, busy - seconds)
+        self.registry.add_time(self.host, "pipeline", seconds)
+        self.registry.add_time(self.host, "pipeline_overlap", overlap)
+        result = {
+            "seconds": round(seconds, 4), "busy": round(busy, 4), "overlap": round(overlap, 4)
+        }
+        if feed:
+            # store waited for the wallbox, fetch waited for the database
+            result["store_wait"] = round(feed.get_wait, 4)
+            result["fetch_wait"] = round(feed.put_wait, 4)
+        logger.info(json.dumps({"event": "pipeline", "host": self.host, **result}))
+        return result
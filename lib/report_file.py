@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+NDJSON Report Files for KEBA Reporter
+records are written one per line while they are imported, optionally gzip or zstd compressed
+orjson is used if installed, the output is the same as with json
+"""
+import os
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# file name extension of the compressions
+COMPRESSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def dumps(record: dict) -> bytes:
+    """
+    one ndjson line, datetimes and decimals as str
+    :param record: dict
+    :return: bytes with newline
+    """
+    if orjson:
+        return orjson.dumps(
+            record, default=str,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_APPEND_NEWLINE
+        )
+    return json.dumps(record, default=str, ensure_ascii=False, separators=(",", ":")).encode() \
+        + b"\n"
+
+
+def zstd_open():
+    """
+    zstd file opener, compression.zstd of python 3.14 or the zstandard package
+    :return: function(file_name) -> binary file object for writing
+    """
+    try:
+        from compression import zstd  # pylint: disable=import-outside-toplevel
+        return lambda file_name: zstd.open(file_name, "wb")
+    except ImportError:
+        pass
+    try:
+        import zstandard  # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise SystemExit("ErrorConfig: zstd compression needs the zstandard package") from error
+    return lambda file_name: zstandard.ZstdCompressor().stream_writer(open(file_name, "wb"))
+
+
+class NdjsonWriter:
+    """write records as ndjson file, the file is replaced when the writer is closed"""
+
+    def __init__(self, directory: str, name: str, compression: str = "none",
+                 buffer_size: int = 1000) -> None:
+        """
+        init class definition
+        :param directory: output directory
+        :param name: file name without extension, e.g. keba_charges
+        :param compression: none, gzip or zstd
+        :param buffer_size: records per write
+        """
+        self.file_name = os.path.join(directory, f"{name}.ndjson{COMPRESSIONS[compression]}")
+        self.tmp_file = self.file_name + ".tmp"
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.records = 0
+        os.makedirs(directory, exist_ok=True)
+        if compression == "gzip":
+            self.file = gzip.open(self.tmp_file, "wb", compresslevel=6)
+        elif compression == "zstd":
+            self.file = zstd_open()(self.tmp_file)
+        else:
+            self.file = open(self.tmp_file, "wb")  # pylint: disable=consider-using-with
+
+    def write(self, record: dict) -> None:
+        """
+        append a record
+        :param record: dict
+        """
+        self.buffer.append(dumps(record))
+        self.records += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """write the buffered records"""
+        if self.buffer:
+            self.file.write(b"".join(self.buffer))
+            self.buffer = []
+
+    def tee(self, records):
+        """
+        pass records through and write them
+        :param records: iterable of dict
+        :return: generator(dict)
+        """
+        for record in records:
+            self.write(record)
+            yield record
+
+    def close(self, store: bool = True) -> None:
+        """
+        finish the file
+        :param store: False to discard, e.g. after a failed import
+        """
+        if store:
+            self.flush()
+        self.file.close()
+        if store:
+            os.replace(self.tmp_file, self.file_name)
+        else:
+            os.remove(self.tmp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(store=exc_type is None)
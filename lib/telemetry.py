@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Live Meter Telemetry for KEBA Reporter
+samples of the wallbox meters are buffered in memory and written downsampled
+"""
+import time
+import logging
+from array import array
+from datetime import datetime
+import keba_model
+
+logger = logging.getLogger("keba.telemetry")
+
+# order of StationMeter.sample()
+SAMPLE_FIELDS = (
+    "MeterValue", "Power", "CurrentL1", "CurrentL2", "CurrentL3",
+    "VoltageL1", "VoltageL2", "VoltageL3", "Temperature"
+)
+
+
+class MeterRingBuffer:
+    """fixed size sample buffer of one station, the oldest samples are overwritten when full"""
+
+    def __init__(self, capacity: int = 4096) -> None:
+        """
+        init class definition
+        one float timestamp and len(SAMPLE_FIELDS) integers per sample, no objects per sample
+        :param capacity: maximum buffered samples
+        """
+        self.capacity = capacity
+        self.width = len(SAMPLE_FIELDS)
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('q', bytes(8 * capacity * self.width))
+        self.first = 0
+        self.count = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: float, sample: tuple) -> None:
+        """
+        add a sample, timestamps have to be ascending
+        :param timestamp: unix timestamp
+        :param sample: tuple in order of SAMPLE_FIELDS
+        """
+        if self.count == self.capacity:
+            self.first = (self.first + 1) % self.capacity
+            self.count -= 1
+            self.dropped += 1
+        index = (self.first + self.count) % self.capacity
+        self.times[index] = timestamp
+        self.values[index * self.width:(index + 1) * self.width] = array('q', sample)
+        self.count += 1
+
+    def pop_until(self, until: float) -> list:
+        """
+        remove and return samples older than until
+        :param until: unix timestamp
+        :return: list of tuples (timestamp, sample)
+        """
+        samples = []
+        while self.count and self.times[self.first] < until:
+            index = self.first
+            samples.append((
+                self.times[index],
+                tuple(self.values[index * self.width:(index + 1) * self.width])
+            ))
+            self.first = (self.first + 1) % self.capacity
+            self.count -= 1
+        return samples
+
+
+def downsample(serial: str, samples: list, resolution: int) -> list:
+    """
+    aggregate samples to one row per station and period
+    power, currents, voltages and temperature are averaged, the meter value is the last one
+    :param serial: station serial number
+    :param samples: list of tuples (timestamp, sample) in ascending order
+    :param resolution: period in seconds
+    :return: list of dict for meter_samples
+    """
+    buckets = {}
+    for timestamp, sample in samples:
+        buckets.setdefault(int(timestamp // resolution) * resolution, []).append(sample)
+
+    rows = []
+    for period, values in buckets.items():
+        columns = list(zip(*values))
+        row = {
+            name: round(sum(column) / len(column))
+            for name, column in zip(SAMPLE_FIELDS, columns)
+        }
+        row.update({
+            "Serial": serial,
+            "Time": datetime.fromtimestamp(period),
+            "Samples": len(values),
+            "MeterValue": values[-1][0],
+            "PowerMax": max(columns[1]),
+        })
+        rows.append(row)
+    return rows
+
+
+class TelemetryCollector:
+    """poll live meter values of all stations, flush downsampled to the database"""
+
+    def __init__(self, keba_session, db_session=None, resolution: int = 60,
+                 capacity: int = 4096) -> None:
+        """
+        init class definition
+        :param keba_session: KebaWallbox
+        :param db_session: KebaDB or KebaParquetStore, None to discard samples
+        :param resolution: seconds per stored row
+        :param capacity: buffered samples per station
+        """
+        self.keba_session = keba_session
+        self.db_session = db_session
+        self.resolution = resolution
+        self.capacity = capacity
+        self.buffers = {}
+
+    def poll(self) -> int:
+        """
+        read live meter values of all stations into the buffers
+        :return: number of sampled stations
+        """
+        timestamp = time.time()
+        sampled = 0
+        for station in self.keba_session.read_stations():
+            if not station.get("meter"):
+                continue
+            buffer = self.buffers.get(station["serialNumber"])
+            if buffer is None:
+                buffer = self.buffers[station["serialNumber"]] = MeterRingBuffer(self.capacity)
+            buffer.append(timestamp, keba_model.StationMeter(**station["meter"]).sample())
+            sampled += 1
+        return sampled
+
+    def flush(self, final: bool = False) -> int:
+        """
+        write completed periods downsampled, the running period stays buffered
+        :param final: write the running period too, e.g. on shutdown
+        :return: number of written rows
+        """
+        until = time.time()
+        if not final:
+            until = until // self.resolution * self.resolution
+        rows = []
+        for serial, buffer in self.buffers.items():
+            if buffer.dropped:
+                logger.warning(
+                    "meter buffer of %s full, %s samples dropped", serial, buffer.dropped
+                )
+                buffer.dropped = 0
+            rows.extend(downsample(serial, buffer.pop_until(until), self.resolution))
+        if rows and self.db_session:
+            self.db_session.insert_meter_samples(rows)
+        return len(rows)
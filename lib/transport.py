@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP Transport for KEBA Reporter
+pooled keep-alive sessions, connect and read timeouts and retries with backoff
+"""
+import os
+import time
+import random
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from metrics import registry
+
+logger = logging.getLogger("keba.transport")
+
+# status codes of a busy or restarting wallbox, retried if the request is idempotent
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+
+
+def request_sent(error: requests.RequestException) -> bool:
+    """
+    tell if a failed request may have reached the wallbox
+    :param error: exception of requests
+    :return: False if the connection could not be established
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return False
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return not isinstance(reason, NewConnectionError)
+
+
+class Transport:
+    """
+    http transport of a wallbox
+    connection errors before the request was sent are always retried,
+    timeouts, broken connections and RETRY_STATUS only for idempotent requests
+    """
+
+    def __init__(
+        self,
+        connect_timeout=float(os.environ.get("KEBA_CONNECT_TIMEOUT", 5)),
+        read_timeout=float(os.environ.get("KEBA_READ_TIMEOUT", 30)),
+        retries=int(os.environ.get("KEBA_RETRIES", 3)),
+        backoff=float(os.environ.get("KEBA_RETRY_BACKOFF", 0.5)),
+        max_backoff: float = 10.0,
+        pool_size: int = 4
+    ) -> None:
+        """
+        init class definition
+        :param connect_timeout: seconds to establish a connection
+        :param read_timeout: seconds between two received bytes
+        :param retries: retries of a failed request, 0 to disable
+        :param backoff: base delay in seconds, doubled on every retry
+        :param max_backoff: maximum delay in seconds
+        :param pool_size: keep-alive connections per session
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+
+    def new_session(self) -> requests.Session:
+        """
+        create http session with a keep-alive connection pool, retries are done by request()
+        :return: session
+        """
+        session = requests.Session()
+        session.verify = False
+        session.trust_env = True
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def delay(self, attempt: int, response=None) -> float:
+        """
+        backoff delay with full jitter, Retry-After of the wallbox is respected
+        :param attempt: number of the failed attempt, starting with 0
+        :param response: failed response or None
+        :return: seconds
+        """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, session: requests.Session, host: str, method: str, url: str,
+                idempotent: bool = True, **kwargs) -> requests.Response:
+        """
+        send a request with timeouts and retries
+        :param session: http session
+        :param host: wallbox hostname for the metrics
+        :param method: http method
+        :param url: request url
+        :param idempotent: False if a repeated request could change the wallbox twice
+        :param kwargs: arguments of requests.Session.request
+        :return: response, the last one if all retries answered with RETRY_STATUS
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            response = None
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.Timeout, requests.ConnectionError) as error:
+                if not idempotent and request_sent(error):
+                    raise SystemExit(f"ErrorAPI: {method} {url} failed: {error}") from error
+                failure = error
+            else:
+                registry.observe(host, "http_request", time.perf_counter() - started)
+                if response.status_code not in RETRY_STATUS or not idempotent:
+                    return response
+                failure = f"status {response.status_code}"
+            registry.count(host, "http_errors")
+            if attempt == self.retries:
+                if response is not None:
+                    # the caller decides about the failed status
+                    return response
+                raise SystemExit(
+                    f"ErrorAPI: {method} {url} failed after {attempt + 1} attempts: {failure}"
+                )
+            delay = self.delay(attempt, response)
+            if response is not None:
+                response.close()
+            logger.warning("%s %s failed (%s), retry in %.1fs", method, url, failure, delay)
+            registry.count(host, "http_retries")
+            time.sleep(delay)
+            attempt += 1